@@ -1,6 +1,16 @@
 #!/usr/bin/env python
+import bisect
+import collections
+import functools
+import itertools
+import sys
+import time
+
+
 class FallInstruction:
     """Type that describes how a brick is falling down"""
+    __slots__ = ("blocktype", "color", "x_pos", "y_stop", "num_rot")
+
     def __init__(self, blocktype, color, x_pos, y_stop, num_rot):
         self.blocktype = blocktype  # Number of the block type
         self.color = color          # Color of the brick
@@ -14,14 +24,635 @@ class NumState:
     def __init__(self):
         self.num_to_draw = -1      # Number/character to draw (ASCII value)
         self.blockindex = 0        # Index of the currently falling brick
-        self.fallindex = 0         # y-position that the brick already has
+        self.fallindex = 0         # y-position that the brick already has (fractional with time-based progression)
         self.x_shift = 0           # x-position relative to the starting point
+        self.settled = SettledLayer()  # Raster of the bricks that already dropped
+        self.timeline = None       # Compiled timeline of the number, when playing back
+        self.placed = None         # PlacedSpans of the timeline's settled bricks, when playing back
+        self.step_time = None      # monotonic time of the last time-based step
+        self.outgoing = SettledLayer()  # Raster of the replaced number while it drops out of view
+        self.outgoing_drop = None  # Rows the outgoing raster dropped, None when there is none
+
+
+class SettledLayer:
+    """Raster of the bricks of a number that already finished falling"""
+    def __init__(self):
+        self.pixels = []           # (x, y, r, g, b) relative to the number's origin
+        self.count = 0             # Number of bricks composited into the raster
+        self.scale = 0             # Scale the raster was built for
+        self.bbox = None           # (x0, y0, x1, y1) covered by the raster
+
+    def reset(self, scale=0):
+        """Drop all composited bricks"""
+        self.pixels = []
+        self.count = 0
+        self.scale = scale
+        self.bbox = None
+
+    def add(self, sprite, x_pos, y_pos, color):
+        """Composite a sprite into the raster"""
+        r, g, b = color
+        self.pixels.extend((x_pos + dx, y_pos + dy, r, g, b) for dx, dy in sprite.pixels)
+        self.count += 1
+        self.bbox = union_rects(self.bbox, sprite_bbox(sprite, x_pos, y_pos))
+
+
+class PlacedSpans:
+    """Settled spans of a timeline expanded to pixels at a fixed origin, so replaying them needs no arithmetic"""
+    def __init__(self, timeline, x_pos, y_pos):
+        self.timeline = timeline   # DigitTimeline the spans belong to
+        self.x = x_pos             # Origin the pixels were placed at
+        self.y = y_pos
+        self.pixels = []           # (x, y, r, g, b) on the canvas, in landing order
+        self.ends = [0]            # Number of pixels of the first n spans, indexed by n
+        self.bbox = None           # (x0, y0, x1, y1) covered by all the spans
+        for dx, dy, n, r, g, b in timeline.settled:
+            x = x_pos + dx
+            y = y_pos + dy
+            self.pixels.extend((x + i, y, r, g, b) for i in range(n))
+            self.ends.append(len(self.pixels))
+            self.bbox = union_rects(self.bbox, (x, y, x + n, y + 1))
 
 
 # Constants
 TETRIS_MAX_NUMBERS = 9
 TETRIS_DISTANCE_BETWEEN_DIGITS = 7
 TETRIS_Y_DROP_DEFAULT = 16
+TETRIS_SPRITE_CACHE_SIZE = 256
+TETRIS_TIMELINE_CACHE_BYTES = 4 * 1024 * 1024
+TETRIS_FALL_PATH_CACHE_SIZE = 1024
+
+# Block offsets of every shape and rotation, in block units relative to the
+# bottom-left block of the shape (negative y is up)
+SHAPE_BLOCKS = {
+    # Square
+    (0, 0): ((0, 0), (1, 0), (0, -1), (1, -1)),
+    (0, 1): ((0, 0), (1, 0), (0, -1), (1, -1)),
+    (0, 2): ((0, 0), (1, 0), (0, -1), (1, -1)),
+    (0, 3): ((0, 0), (1, 0), (0, -1), (1, -1)),
+    # L-Shape
+    (1, 0): ((0, 0), (1, 0), (0, -1), (0, -2)),
+    (1, 1): ((0, 0), (0, -1), (1, -1), (2, -1)),
+    (1, 2): ((1, 0), (1, -1), (1, -2), (0, -2)),
+    (1, 3): ((0, 0), (1, 0), (2, 0), (2, -1)),
+    # L-Shape (reverse)
+    (2, 0): ((0, 0), (1, 0), (1, -1), (1, -2)),
+    (2, 1): ((0, 0), (1, 0), (2, 0), (0, -1)),
+    (2, 2): ((0, 0), (0, -1), (0, -2), (1, -2)),
+    (2, 3): ((0, -1), (1, -1), (2, -1), (2, 0)),
+    # I-Shape
+    (3, 0): ((0, 0), (1, 0), (2, 0), (3, 0)),
+    (3, 1): ((0, 0), (0, -1), (0, -2), (0, -3)),
+    (3, 2): ((0, 0), (1, 0), (2, 0), (3, 0)),
+    (3, 3): ((0, 0), (0, -1), (0, -2), (0, -3)),
+    # S-Shape
+    (4, 0): ((1, 0), (0, -1), (1, -1), (0, -2)),
+    (4, 1): ((0, 0), (1, 0), (1, -1), (2, -1)),
+    (4, 2): ((1, 0), (0, -1), (1, -1), (0, -2)),
+    (4, 3): ((0, 0), (1, 0), (1, -1), (2, -1)),
+    # S-Shape (reversed)
+    (5, 0): ((0, 0), (0, -1), (1, -1), (1, -2)),
+    (5, 1): ((1, 0), (2, 0), (0, -1), (1, -1)),
+    (5, 2): ((0, 0), (0, -1), (1, -1), (1, -2)),
+    (5, 3): ((1, 0), (2, 0), (0, -1), (1, -1)),
+    # Half cross
+    (6, 0): ((0, 0), (1, 0), (2, 0), (1, -1)),
+    (6, 1): ((0, 0), (0, -1), (0, -2), (1, -1)),
+    (6, 2): ((1, 0), (0, -1), (1, -1), (2, -1)),
+    (6, 3): ((1, 0), (0, -1), (1, -1), (1, -2)),
+    # Corner-Shape
+    (7, 0): ((0, 0), (1, 0), (0, -1)),
+    (7, 1): ((0, 0), (0, -1), (1, -1)),
+    (7, 2): ((1, 0), (1, -1), (0, -1)),
+    (7, 3): ((0, 0), (1, 0), (1, -1)),
+}
+
+
+class Sprite:
+    """Pixel offsets of a scaled shape, relative to the shape's drawing position"""
+    def __init__(self, blocks, scale):
+        self.scale = scale
+        # Top-left pixel offset of every scaled block
+        self.blocks = tuple((bx * scale, by * scale) for bx, by in blocks)
+        # Offsets of every pixel covered by the shape
+        self.pixels = tuple((x + i, y + j) for x, y in self.blocks
+                            for i in range(scale) for j in range(scale))
+        if self.blocks:
+            self.min_x = min(x for x, _ in self.blocks)
+            self.min_y = min(y for _, y in self.blocks)
+            self.max_x = max(x for x, _ in self.blocks) + scale
+            self.max_y = max(y for _, y in self.blocks) + scale
+        else:
+            self.min_x = self.min_y = self.max_x = self.max_y = 0
+        # Horizontal (x, y, length) runs covering the shape
+        self.spans = pixels_to_spans(self.pixels)
+
+
+def pixels_to_spans(pixels):
+    """Convert (x, y) pixels into horizontal (x, y, length) runs"""
+    rows = {}
+    for x, y in set(pixels):
+        rows.setdefault(y, []).append(x)
+    spans = []
+    for y in sorted(rows):
+        xs = sorted(rows[y])
+        start = prev = xs[0]
+        for x in xs[1:]:
+            if x != prev + 1:
+                spans.append((start, y, prev - start + 1))
+                start = x
+            prev = x
+        spans.append((start, y, prev - start + 1))
+    return tuple(spans)
+
+
+@functools.lru_cache(maxsize=TETRIS_SPRITE_CACHE_SIZE)
+def get_sprite(blocktype, num_rot, scale):
+    """Return the cached sprite of a shape in a given rotation and scale"""
+    return Sprite(SHAPE_BLOCKS.get((blocktype, num_rot), ()), scale)
+
+
+def sprite_bbox(sprite, x_pos, y_pos):
+    """Return the (x0, y0, x1, y1) rectangle covered by a sprite drawn at the given position"""
+    return (x_pos + sprite.min_x, y_pos + sprite.min_y, x_pos + sprite.max_x, y_pos + sprite.max_y)
+
+
+def union_rects(a, b):
+    """Return the bounding box of two rectangles, either of which may be None"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def intersect_rects(a, b):
+    """Return the intersection of two rectangles, or None if they do not overlap"""
+    x0 = max(a[0], b[0])
+    y0 = max(a[1], b[1])
+    x1 = min(a[2], b[2])
+    y1 = min(a[3], b[3])
+    if x0 < x1 and y0 < y1:
+        return (x0, y0, x1, y1)
+    return None
+
+
+def get_rotation(current_fall, fallindex):
+    """Return the rotation of a falling brick, which turns gradually while it drops"""
+    rotations = current_fall.num_rot
+    if rotations == 1:
+        if fallindex < int(current_fall.y_stop / 2):
+            rotations = 0
+    elif rotations == 2:
+        if fallindex < int(current_fall.y_stop / 3):
+            rotations = 0
+        elif fallindex < int(current_fall.y_stop / 3 * 2):
+            rotations = 1
+    elif rotations == 3:
+        if fallindex < int(current_fall.y_stop / 4):
+            rotations = 0
+        elif fallindex < int(current_fall.y_stop / 4 * 2):
+            rotations = 1
+        elif fallindex < int(current_fall.y_stop / 4 * 3):
+            rotations = 2
+    return rotations
+
+
+@functools.lru_cache(maxsize=TETRIS_FALL_PATH_CACHE_SIZE)
+def get_fall_path(current_fall, scale):
+    """Return the (sprite, x, y) of a falling brick for every pixel it drops, relative to the number's origin"""
+    scaled_y_offset = scale if scale > 1 else 1
+    x_pos = current_fall.x_pos * scale
+    return tuple(
+        (get_sprite(current_fall.blocktype, get_rotation(current_fall, pixel // scaled_y_offset), scale),
+         x_pos, pixel - scaled_y_offset)
+        for pixel in range(current_fall.y_stop * scaled_y_offset + 1)
+    )
+
+
+def snap_steps(position):
+    """Round a position counted in rows or pixels to a whole one if it is only off by float error"""
+    nearest = round(position)
+    return nearest if abs(position - nearest) < 1e-6 else position
+
+
+# Approximate memory used by one (x, y, length, r, g, b) span in a timeline
+_SPAN_BYTES = sys.getsizeof((0,) * 6) + 8
+
+
+class DigitTimeline:
+    """Frame-indexed pixel spans of a number's animation, relative to the number's origin"""
+    def __init__(self, scale):
+        self.scale = scale         # Scale the timeline was compiled for
+        self.frames = []           # (falling brick spans or None, number of settled spans) per frame
+        self.start = []            # Index of the first frame of every brick
+        self.settled = []          # (x, y, length, r, g, b) spans of the dropped bricks, in landing order
+        self.nbytes = 0            # Approximate memory used by the timeline
+
+    def frame_at(self, blockindex, fallindex):
+        """Return the frame drawn while brick blockindex is at row fallindex"""
+        return self.frames[self.start[blockindex] + fallindex]
+
+
+def compile_timeline(number_array, scale, colors):
+    """Compile a number's fall instructions into a DigitTimeline at the given scale"""
+    timeline = DigitTimeline(scale)
+    scaled_y_offset = scale if scale > 1 else 1
+    span_count = 0
+    for current_fall in number_array:
+        timeline.start.append(len(timeline.frames))
+        r, g, b = colors[current_fall.color]
+        x_pos = current_fall.x_pos * scale
+        for fallindex in range(current_fall.y_stop + 1):
+            sprite = get_sprite(current_fall.blocktype, get_rotation(current_fall, fallindex), scale)
+            y_pos = (fallindex * scaled_y_offset) - scaled_y_offset
+            falling = tuple((x_pos + dx, y_pos + dy, n, r, g, b) for dx, dy, n in sprite.spans)
+            span_count += len(falling)
+            # The brick is part of the settled ones as soon as it reached y_stop
+            if fallindex == current_fall.y_stop:
+                sprite = get_sprite(current_fall.blocktype, current_fall.num_rot, scale)
+                timeline.settled.extend((x_pos + dx, y_pos + dy, n, r, g, b) for dx, dy, n in sprite.spans)
+            timeline.frames.append((falling, len(timeline.settled)))
+    timeline.start.append(len(timeline.frames))
+    timeline.frames.append((None, len(timeline.settled)))
+    timeline.nbytes = (span_count + len(timeline.settled)) * _SPAN_BYTES + len(timeline.frames) * 64
+    return timeline
+
+
+class TimelineCache:
+    """LRU cache of compiled timelines, bounded by their approximate memory use"""
+    def __init__(self, max_bytes=TETRIS_TIMELINE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._timelines = collections.OrderedDict()
+
+    def get(self, number_array, scale, colors):
+        """Return the timeline of a number's fall instructions, compiling it if needed"""
+        key = (
+            tuple((f.blocktype, f.color, f.x_pos, f.y_stop, f.num_rot) for f in number_array),
+            scale,
+            tuple(colors)
+        )
+        timeline = self._timelines.get(key)
+        if timeline is not None:
+            self._timelines.move_to_end(key)
+            return timeline
+        
+        timeline = compile_timeline(number_array, scale, colors)
+        self.add(number_array, scale, colors, timeline)
+        return timeline
+
+    def add(self, number_array, scale, colors, timeline):
+        """Store a timeline compiled elsewhere, e.g. loaded from an asset cache"""
+        key = (
+            tuple((f.blocktype, f.color, f.x_pos, f.y_stop, f.num_rot) for f in number_array),
+            scale,
+            tuple(colors)
+        )
+        if key in self._timelines:
+            self.nbytes -= self._timelines.pop(key).nbytes
+        self._timelines[key] = timeline
+        self.nbytes += timeline.nbytes
+        # Always keep the newest timeline, even if it alone exceeds the cap
+        while self.nbytes > self.max_bytes and len(self._timelines) > 1:
+            _, evicted = self._timelines.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return timeline
+
+
+def merge_rects(rects):
+    """Merge overlapping rectangles until none of them overlap"""
+    merged = []
+    for x0, y0, x1, y1 in set(rects):
+        i = 0
+        while i < len(merged):
+            other = merged[i]
+            if x0 < other[2] and other[0] < x1 and y0 < other[3] and other[1] < y1:
+                # Absorb the overlapping rectangle and check the others again
+                merged[i] = merged[-1]
+                merged.pop()
+                x0 = min(x0, other[0])
+                y0 = min(y0, other[1])
+                x1 = max(x1, other[2])
+                y1 = max(y1, other[3])
+                i = 0
+            else:
+                i += 1
+        merged.append((x0, y0, x1, y1))
+    return merged
+
+
+# Tetris colors (RGB)
+TETRIS_RED = (255, 0, 0)
+TETRIS_GREEN = (0, 255, 0)
+TETRIS_BLUE = (0, 50, 255)
+TETRIS_WHITE = (255, 255, 255)
+TETRIS_YELLOW = (255, 255, 0)
+TETRIS_CYAN = (0, 255, 255)
+TETRIS_MAGENTA = (255, 0, 255)
+TETRIS_ORANGE = (255, 128, 0)
+TETRIS_BLACK = (0, 0, 0)
+
+TETRIS_COLORS = (
+    TETRIS_RED,
+    TETRIS_GREEN,
+    TETRIS_BLUE,
+    TETRIS_WHITE,
+    TETRIS_YELLOW,
+    TETRIS_CYAN,
+    TETRIS_MAGENTA,
+    TETRIS_ORANGE,
+    TETRIS_BLACK
+)
+
+# Fall instructions of the numbers 0-9, shared read-only by all TetrisMatrixDraw instances
+NUMBER_ARRAYS = (
+    # Number 0 fall instructions
+    (
+        FallInstruction(2, 5, 4, 16, 0),
+        FallInstruction(4, 7, 2, 16, 1),
+        FallInstruction(3, 4, 0, 16, 1),
+        FallInstruction(6, 6, 1, 16, 1),
+        FallInstruction(5, 1, 4, 14, 0),
+        FallInstruction(6, 6, 0, 13, 3),
+        FallInstruction(5, 1, 4, 12, 0),
+        FallInstruction(5, 1, 0, 11, 0),
+        FallInstruction(6, 6, 4, 10, 1),
+        FallInstruction(6, 6, 0, 9, 1),
+        FallInstruction(5, 1, 1, 8, 1),
+        FallInstruction(2, 5, 3, 8, 3),
+    ),
+    # Number 1 fall instructions
+    (
+        FallInstruction(2, 5, 4, 16, 0),
+        FallInstruction(3, 4, 4, 15, 1),
+        FallInstruction(3, 4, 5, 13, 3),
+        FallInstruction(2, 5, 4, 11, 2),
+        FallInstruction(0, 0, 4, 8, 0),
+    ),
+    # Number 2 fall instructions
+    (
+        FallInstruction(0, 0, 4, 16, 0),
+        FallInstruction(3, 4, 0, 16, 1),
+        FallInstruction(1, 2, 1, 16, 3),
+        FallInstruction(1, 2, 1, 15, 0),
+        FallInstruction(3, 4, 1, 12, 2),
+        FallInstruction(1, 2, 0, 12, 1),
+        FallInstruction(2, 5, 3, 12, 3),
+        FallInstruction(0, 0, 4, 10, 0),
+        FallInstruction(3, 4, 1, 8, 0),
+        FallInstruction(2, 5, 3, 8, 3),
+        FallInstruction(1, 2, 0, 8, 1),
+    ),
+    # Number 3 fall instructions
+    (
+        FallInstruction(1, 2, 3, 16, 3),
+        FallInstruction(2, 5, 0, 16, 1),
+        FallInstruction(3, 4, 1, 15, 2),
+        FallInstruction(0, 0, 4, 14, 0),
+        FallInstruction(3, 4, 1, 12, 2),
+        FallInstruction(1, 2, 0, 12, 1),
+        FallInstruction(3, 4, 5, 12, 3),
+        FallInstruction(2, 5, 3, 11, 0),
+        FallInstruction(3, 4, 1, 8, 0),
+        FallInstruction(1, 2, 0, 8, 1),
+        FallInstruction(2, 5, 3, 8, 3),
+    ),
+    # Number 4 fall instructions
+    (
+        FallInstruction(0, 0, 4, 16, 0),
+        FallInstruction(0, 0, 4, 14, 0),
+        FallInstruction(3, 4, 1, 12, 0),
+        FallInstruction(1, 2, 0, 12, 1),
+        FallInstruction(2, 5, 0, 10, 0),
+        FallInstruction(2, 5, 3, 12, 3),
+        FallInstruction(3, 4, 4, 10, 3),
+        FallInstruction(2, 5, 0, 9, 2),
+        FallInstruction(3, 4, 5, 10, 1),
+    ),
+    # Number 5 fall instructions
+    (
+        FallInstruction(0, 0, 0, 16, 0),
+        FallInstruction(2, 5, 2, 16, 1),
+        FallInstruction(2, 5, 3, 15, 0),
+        FallInstruction(3, 4, 5, 16, 1),
+        FallInstruction(3, 4, 1, 12, 0),
+        FallInstruction(1, 2, 0, 12, 1),
+        FallInstruction(2, 5, 3, 12, 3),
+        FallInstruction(0, 0, 0, 10, 0),
+        FallInstruction(3, 4, 1, 8, 2),
+        FallInstruction(1, 2, 0, 8, 1),
+        FallInstruction(2, 5, 3, 8, 3),
+    ),
+    # Number 6 fall instructions
+    (
+        FallInstruction(2, 5, 0, 16, 1),
+        FallInstruction(5, 1, 2, 16, 1),
+        FallInstruction(6, 6, 0, 15, 3),
+        FallInstruction(6, 6, 4, 16, 3),
+        FallInstruction(5, 1, 4, 14, 0),
+        FallInstruction(3, 4, 1, 12, 2),
+        FallInstruction(2, 5, 0, 13, 2),
+        FallInstruction(3, 4, 2, 11, 0),
+        FallInstruction(0, 0, 0, 10, 0),
+        FallInstruction(3, 4, 1, 8, 0),
+        FallInstruction(1, 2, 0, 8, 1),
+        FallInstruction(2, 5, 3, 8, 3),
+    ),
+    # Number 7 fall instructions
+    (
+        FallInstruction(0, 0, 4, 16, 0),
+        FallInstruction(1, 2, 4, 14, 0),
+        FallInstruction(3, 4, 5, 13, 1),
+        FallInstruction(2, 5, 4, 11, 2),
+        FallInstruction(3, 4, 1, 8, 2),
+        FallInstruction(2, 5, 3, 8, 3),
+        FallInstruction(1, 2, 0, 8, 1),
+    ),
+    # Number 8 fall instructions
+    (
+        FallInstruction(3, 4, 1, 16, 0),
+        FallInstruction(6, 6, 0, 16, 1),
+        FallInstruction(3, 4, 5, 16, 1),
+        FallInstruction(1, 2, 2, 15, 3),
+        FallInstruction(4, 7, 0, 14, 0),
+        FallInstruction(1, 2, 1, 12, 3),
+        FallInstruction(6, 6, 4, 13, 1),
+        FallInstruction(2, 5, 0, 11, 1),
+        FallInstruction(4, 7, 0, 10, 0),
+        FallInstruction(4, 7, 4, 11, 0),
+        FallInstruction(5, 1, 0, 8, 1),
+        FallInstruction(5, 1, 2, 8, 1),
+        FallInstruction(1, 2, 4, 9, 2),
+    ),
+    # Number 9 fall instructions
+    (
+        FallInstruction(0, 0, 0, 16, 0),
+        FallInstruction(3, 4, 2, 16, 0),
+        FallInstruction(1, 2, 2, 15, 3),
+        FallInstruction(1, 2, 4, 15, 2),
+        FallInstruction(3, 4, 1, 12, 2),
+        FallInstruction(3, 4, 5, 12, 3),
+        FallInstruction(5, 1, 0, 12, 0),
+        FallInstruction(1, 2, 2, 11, 3),
+        FallInstruction(5, 1, 4, 9, 0),
+        FallInstruction(6, 6, 0, 10, 1),
+        FallInstruction(5, 1, 0, 8, 1),
+        FallInstruction(6, 6, 2, 8, 2),
+    ),
+)
+
+# Number of bricks of every number, derived from the tables above
+BLOCKS_PER_NUMBER = tuple(len(number_array) for number_array in NUMBER_ARRAYS)
+
+# Color of every brick shape, as used by the numbers above
+SHAPE_COLORS = {0: 0, 1: 2, 2: 5, 3: 4, 4: 7, 5: 1, 6: 6, 7: 3}
+
+# Shapes tried when stacking a glyph, most interesting first
+GLYPH_SHAPE_ORDER = (1, 6, 2, 4, 5, 3, 0, 7)
+GLYPH_TILING_BUDGET = 20000    # Placements tried before falling back to squares only
+
+# 3x5 bitmaps of the letters and symbols, every cell becomes 2x2 blocks like the strokes of the numbers
+GLYPH_BITMAPS = {
+    "A": ("###", "#.#", "###", "#.#", "#.#"),
+    "B": ("##.", "#.#", "##.", "#.#", "##."),
+    "C": ("###", "#..", "#..", "#..", "###"),
+    "D": ("##.", "#.#", "#.#", "#.#", "##."),
+    "E": ("###", "#..", "##.", "#..", "###"),
+    "F": ("###", "#..", "##.", "#..", "#.."),
+    "G": ("###", "#..", "#.#", "#.#", "###"),
+    "H": ("#.#", "#.#", "###", "#.#", "#.#"),
+    "I": ("###", ".#.", ".#.", ".#.", "###"),
+    "J": ("..#", "..#", "..#", "#.#", "###"),
+    "K": ("#.#", "#.#", "##.", "#.#", "#.#"),
+    "L": ("#..", "#..", "#..", "#..", "###"),
+    "M": ("#.#", "###", "###", "#.#", "#.#"),
+    "N": ("###", "#.#", "#.#", "#.#", "#.#"),
+    "O": ("###", "#.#", "#.#", "#.#", "###"),
+    "P": ("###", "#.#", "###", "#..", "#.."),
+    "Q": ("###", "#.#", "#.#", "###", "..#"),
+    "R": ("###", "#.#", "##.", "#.#", "#.#"),
+    "S": ("###", "#..", "###", "..#", "###"),
+    "T": ("###", ".#.", ".#.", ".#.", ".#."),
+    "U": ("#.#", "#.#", "#.#", "#.#", "###"),
+    "V": ("#.#", "#.#", "#.#", "#.#", ".#."),
+    "W": ("#.#", "#.#", "###", "###", "#.#"),
+    "X": ("#.#", "#.#", ".#.", "#.#", "#.#"),
+    "Y": ("#.#", "#.#", "###", ".#.", ".#."),
+    "Z": ("###", "..#", ".#.", "#..", "###"),
+    " ": ("..", "..", "..", "..", ".."),
+    ".": (".", ".", ".", ".", "#"),
+    ",": (".", ".", ".", "#", "#"),
+    ":": (".", "#", ".", "#", "."),
+    "!": ("#", "#", "#", ".", "#"),
+    "?": ("###", "..#", ".##", "...", ".#."),
+    "-": ("...", "...", "###", "...", "..."),
+    "+": ("...", ".#.", "###", ".#.", "..."),
+    "/": ("..#", "..#", ".#.", "#..", "#.."),
+    "'": ("#", "#", ".", ".", "."),
+    "%": ("#.#", "..#", ".#.", "#..", "#.#"),
+    "°": ("###", "#.#", "###", "...", "..."),
+}
+
+
+def _tile_cells(cells):
+    """Cover a set of (x, y) blocks with brick shapes, returns (blocktype, rotation, x, y) placements
+
+    Bricks are placed from the bottom-left blocks up, so they can drop in
+    that order. A depth-first search tries the shapes in GLYPH_SHAPE_ORDER,
+    starting one shape later for every brick to mix them up; if it runs over
+    budget, every 2x2 square becomes a square brick instead.
+    """
+    shapes_by_type = []
+    for blocktype in GLYPH_SHAPE_ORDER:
+        shapes = []
+        seen = set()
+        for rot in range(4):
+            blocks = SHAPE_BLOCKS[(blocktype, rot)]
+            if frozenset(blocks) not in seen:
+                seen.add(frozenset(blocks))
+                shapes.append((blocktype, rot, blocks))
+        shapes_by_type.append(shapes)
+
+    budget = [GLYPH_TILING_BUDGET]
+
+    def search(remaining, placements):
+        if not remaining:
+            return placements
+        # The bottom-left block has to be covered by the next brick
+        cx, cy = min(remaining, key=lambda cell: (-cell[1], cell[0]))
+        start = len(placements) % len(shapes_by_type)
+        for blocktype, rot, blocks in itertools.chain(*shapes_by_type[start:], *shapes_by_type[:start]):
+            for bx, by in blocks:
+                x, y = cx - bx, cy - by
+                covered = {(x + dx, y + dy) for dx, dy in blocks}
+                if covered <= remaining:
+                    budget[0] -= 1
+                    if budget[0] < 0:
+                        return None
+                    result = search(remaining - covered, placements + [(blocktype, rot, x, y)])
+                    if result is not None:
+                        return result
+        return None
+
+    placements = search(frozenset(cells), [])
+    if placements is None:
+        placements = [(0, 0, x, y) for x, y in sorted(cells, key=lambda cell: (-cell[1], cell[0]))
+                      if x % 2 == 0 and y % 2 == 1]
+    return placements
+
+
+def glyph_from_bitmap(rows, block=2):
+    """Return fall instructions that stack bricks into a bitmap, given as strings of '#' and '.'
+
+    Every cell becomes block x block blocks and the bottom row lands where
+    the numbers end.
+    """
+    height = len(rows) * block
+    cells = set()
+    for r, row in enumerate(rows):
+        for c, char in enumerate(row):
+            if char == "#":
+                cells.update((c * block + i, TETRIS_Y_DROP_DEFAULT - height + r * block + j)
+                             for i in range(block) for j in range(block))
+    return tuple(FallInstruction(blocktype, SHAPE_COLORS[blocktype], x, y + 1, rot)
+                 for blocktype, rot, x, y in _tile_cells(cells))
+
+
+# Fall instructions and widths in blocks by glyph id, the numbers 0-9 come first
+GLYPH_ARRAYS = list(NUMBER_ARRAYS)
+BLOCKS_PER_GLYPH = list(BLOCKS_PER_NUMBER)
+GLYPH_WIDTHS = [6] * len(NUMBER_ARRAYS)
+# Glyph id of every character
+GLYPH_INDEX = {str(digit): digit for digit in range(len(NUMBER_ARRAYS))}
+
+
+def register_glyph(char, instructions, width):
+    """Add a character to the glyph index, or replace it; width is in blocks"""
+    glyph = GLYPH_INDEX.get(char)
+    if glyph is None or glyph < len(NUMBER_ARRAYS):
+        glyph = len(GLYPH_ARRAYS)
+        GLYPH_ARRAYS.append(None)
+        BLOCKS_PER_GLYPH.append(0)
+        GLYPH_WIDTHS.append(0)
+        GLYPH_INDEX[char] = glyph
+    GLYPH_ARRAYS[glyph] = tuple(instructions)
+    BLOCKS_PER_GLYPH[glyph] = len(GLYPH_ARRAYS[glyph])
+    GLYPH_WIDTHS[glyph] = width
+    return glyph
+
+
+def register_bitmap_glyph(char, rows, block=2):
+    """Add a character to the glyph index from a bitmap, see glyph_from_bitmap"""
+    return register_glyph(char, glyph_from_bitmap(rows, block), len(rows[0]) * block)
+
+
+def glyph_id(char):
+    """Return the glyph id of a character, stacking the bricks of GLYPH_BITMAPS on first use; None if unknown"""
+    glyph = GLYPH_INDEX.get(char)
+    if glyph is None and char in GLYPH_BITMAPS:
+        glyph = register_bitmap_glyph(char, GLYPH_BITMAPS[char])
+    return glyph
 
 
 class TetrisMatrixDraw:
@@ -32,197 +663,75 @@ class TetrisMatrixDraw:
         self.numstates = [NumState() for _ in range(TETRIS_MAX_NUMBERS)]
         self.sizeOfValue = 0
         self.scale = 1
+        self.clip = None           # (x0, y0, x1, y1) rectangle drawing is limited to
+        self.damage = None         # Rectangles repainted by the last update_numbers call
+        self._scene = {}           # Items drawn by the last update_numbers call
+        self.buffer_count = 2      # Canvases rotating through the display, for update_numbers
+        self._damage_history = collections.deque(maxlen=1)  # Rectangles changed in recent frames
+        self._full_damage = True   # Repaint the whole canvas on the next update
+        self.timelines = None      # TimelineCache that draw_numbers replays from, if any
+        self.pixel_writes = 0      # Pixels submitted to the canvas, before clipping
+        self.bulk_writes = 0       # Bulk frame pushes to the canvas
+        self.rows_per_second = None  # Fall speed for time-based progression, None for one row per frame
+        self.clear_outgoing = False  # Drop replaced numbers out of view before the new ones fall
+        self.smooth = False        # Move falling bricks pixel by pixel instead of a block at a time
+        self.clock = time.monotonic
         
-        # Define Tetris colors (RGB)
-        self.tetrisRED = (255, 0, 0)
-        self.tetrisGREEN = (0, 255, 0)
-        self.tetrisBLUE = (0, 50, 255)
-        self.tetrisWHITE = (255, 255, 255)
-        self.tetrisYELLOW = (255, 255, 0)
-        self.tetrisCYAN = (0, 255, 255)
-        self.tetrisMAGENTA = (255, 0, 255)
-        self.tetrisORANGE = (255, 128, 0)
-        self.tetrisBLACK = (0, 0, 0)
-        
-        self.tetrisColors = [
-            self.tetrisRED, 
-            self.tetrisGREEN, 
-            self.tetrisBLUE, 
-            self.tetrisWHITE, 
-            self.tetrisYELLOW, 
-            self.tetrisCYAN, 
-            self.tetrisMAGENTA, 
-            self.tetrisORANGE,
-            self.tetrisBLACK
-        ]
-
-        self.num_0 = [
-            FallInstruction(2, 5, 4, 16, 0),
-            FallInstruction(4, 7, 2, 16, 1),
-            FallInstruction(3, 4, 0, 16, 1),
-            FallInstruction(6, 6, 1, 16, 1),
-            FallInstruction(5, 1, 4, 14, 0),
-            FallInstruction(6, 6, 0, 13, 3),
-            FallInstruction(5, 1, 4, 12, 0),
-            FallInstruction(5, 1, 0, 11, 0),
-            FallInstruction(6, 6, 4, 10, 1),
-            FallInstruction(6, 6, 0, 9, 1),
-            FallInstruction(5, 1, 1, 8, 1),
-            FallInstruction(2, 5, 3, 8, 3)
-        ]
-        
-        # Number 1 fall instructions
-        self.num_1 = [
-            FallInstruction(2, 5, 4, 16, 0),
-            FallInstruction(3, 4, 4, 15, 1),
-            FallInstruction(3, 4, 5, 13, 3),
-            FallInstruction(2, 5, 4, 11, 2),
-            FallInstruction(0, 0, 4, 8, 0)
-        ]
-        
-        # Number 2 fall instructions
-        self.num_2 = [
-            FallInstruction(0, 0, 4, 16, 0),
-            FallInstruction(3, 4, 0, 16, 1),
-            FallInstruction(1, 2, 1, 16, 3),
-            FallInstruction(1, 2, 1, 15, 0),
-            FallInstruction(3, 4, 1, 12, 2),
-            FallInstruction(1, 2, 0, 12, 1),
-            FallInstruction(2, 5, 3, 12, 3),
-            FallInstruction(0, 0, 4, 10, 0),
-            FallInstruction(3, 4, 1, 8, 0),
-            FallInstruction(2, 5, 3, 8, 3),
-            FallInstruction(1, 2, 0, 8, 1)
-        ]
-        
-        # Number 3 fall instructions
-        self.num_3 = [
-            FallInstruction(1, 2, 3, 16, 3),
-            FallInstruction(2, 5, 0, 16, 1),
-            FallInstruction(3, 4, 1, 15, 2),
-            FallInstruction(0, 0, 4, 14, 0),
-            FallInstruction(3, 4, 1, 12, 2),
-            FallInstruction(1, 2, 0, 12, 1),
-            FallInstruction(3, 4, 5, 12, 3),
-            FallInstruction(2, 5, 3, 11, 0),
-            FallInstruction(3, 4, 1, 8, 0),
-            FallInstruction(1, 2, 0, 8, 1),
-            FallInstruction(2, 5, 3, 8, 3)
-        ]
+        # Text drawn by draw_text, see set_text
+        self.text_layout = []      # (x in blocks, glyph id) of every character
+        self.text_width = 0        # Width of the text in blocks
+        self.text_states = {}      # Character index -> NumState, for the characters in view
+        self.text_scroll = 0       # Pixels the text scrolled to the left
+        self._text_starts = []     # x of every character, for finding the ones in view
+        self._text_max_width = 0   # Width of the widest glyph of the text
         
-        # Number 4 fall instructions
-        self.num_4 = [
-            FallInstruction(0, 0, 4, 16, 0),
-            FallInstruction(0, 0, 4, 14, 0),
-            FallInstruction(3, 4, 1, 12, 0),
-            FallInstruction(1, 2, 0, 12, 1),
-            FallInstruction(2, 5, 0, 10, 0),
-            FallInstruction(2, 5, 3, 12, 3),
-            FallInstruction(3, 4, 4, 10, 3),
-            FallInstruction(2, 5, 0, 9, 2),
-            FallInstruction(3, 4, 5, 10, 1)
-        ]
+        # Tetris colors (RGB), shared with the module-level palette
+        self.tetrisRED = TETRIS_RED
+        self.tetrisGREEN = TETRIS_GREEN
+        self.tetrisBLUE = TETRIS_BLUE
+        self.tetrisWHITE = TETRIS_WHITE
+        self.tetrisYELLOW = TETRIS_YELLOW
+        self.tetrisCYAN = TETRIS_CYAN
+        self.tetrisMAGENTA = TETRIS_MAGENTA
+        self.tetrisORANGE = TETRIS_ORANGE
+        self.tetrisBLACK = TETRIS_BLACK
+        self.tetrisColors = TETRIS_COLORS
         
-        # Number 5 fall instructions
-        self.num_5 = [
-            FallInstruction(0, 0, 0, 16, 0),
-            FallInstruction(2, 5, 2, 16, 1),
-            FallInstruction(2, 5, 3, 15, 0),
-            FallInstruction(3, 4, 5, 16, 1),
-            FallInstruction(3, 4, 1, 12, 0),
-            FallInstruction(1, 2, 0, 12, 1),
-            FallInstruction(2, 5, 3, 12, 3),
-            FallInstruction(0, 0, 0, 10, 0),
-            FallInstruction(3, 4, 1, 8, 2),
-            FallInstruction(1, 2, 0, 8, 1),
-            FallInstruction(2, 5, 3, 8, 3)
-        ]
-        
-        # Number 6 fall instructions
-        self.num_6 = [
-            FallInstruction(2, 5, 0, 16, 1),
-            FallInstruction(5, 1, 2, 16, 1),
-            FallInstruction(6, 6, 0, 15, 3),
-            FallInstruction(6, 6, 4, 16, 3),
-            FallInstruction(5, 1, 4, 14, 0),
-            FallInstruction(3, 4, 1, 12, 2),
-            FallInstruction(2, 5, 0, 13, 2),
-            FallInstruction(3, 4, 2, 11, 0),
-            FallInstruction(0, 0, 0, 10, 0),
-            FallInstruction(3, 4, 1, 8, 0),
-            FallInstruction(1, 2, 0, 8, 1),
-            FallInstruction(2, 5, 3, 8, 3)
-        ]
-        
-        # Number 7 fall instructions
-        self.num_7 = [
-            FallInstruction(0, 0, 4, 16, 0),
-            FallInstruction(1, 2, 4, 14, 0),
-            FallInstruction(3, 4, 5, 13, 1),
-            FallInstruction(2, 5, 4, 11, 2),
-            FallInstruction(3, 4, 1, 8, 2),
-            FallInstruction(2, 5, 3, 8, 3),
-            FallInstruction(1, 2, 0, 8, 1)
-        ]
-        
-        # Number 8 fall instructions
-        self.num_8 = [
-            FallInstruction(3, 4, 1, 16, 0),
-            FallInstruction(6, 6, 0, 16, 1),
-            FallInstruction(3, 4, 5, 16, 1),
-            FallInstruction(1, 2, 2, 15, 3),
-            FallInstruction(4, 7, 0, 14, 0),
-            FallInstruction(1, 2, 1, 12, 3),
-            FallInstruction(6, 6, 4, 13, 1),
-            FallInstruction(2, 5, 0, 11, 1),
-            FallInstruction(4, 7, 0, 10, 0),
-            FallInstruction(4, 7, 4, 11, 0),
-            FallInstruction(5, 1, 0, 8, 1),
-            FallInstruction(5, 1, 2, 8, 1),
-            FallInstruction(1, 2, 4, 9, 2)
-        ]
-        
-        # Number 9 fall instructions
-        self.num_9 = [
-            FallInstruction(0, 0, 0, 16, 0),
-            FallInstruction(3, 4, 2, 16, 0),
-            FallInstruction(1, 2, 2, 15, 3),
-            FallInstruction(1, 2, 4, 15, 2),
-            FallInstruction(3, 4, 1, 12, 2),
-            FallInstruction(3, 4, 5, 12, 3),
-            FallInstruction(5, 1, 0, 12, 0),
-            FallInstruction(1, 2, 2, 11, 3),
-            FallInstruction(5, 1, 4, 9, 0),
-            FallInstruction(6, 6, 0, 10, 1),
-            FallInstruction(5, 1, 0, 8, 1),
-            FallInstruction(6, 6, 2, 8, 2)
-        ]
-        
-        # Store sizes of each number's fall instruction array
-        self.blocks_per_number = [12, 5, 11, 11, 9, 11, 12, 7, 13, 12]
-        
-        # Store references to number arrays for easy access
-        self.number_arrays = [
-            self.num_0, self.num_1, self.num_2, self.num_3, self.num_4,
-            self.num_5, self.num_6, self.num_7, self.num_8, self.num_9
-        ]
+        # Fall instructions, sizes and widths by glyph id, shared with the
+        # module-level tables; ids 0-9 are the numbers
+        self.number_arrays = GLYPH_ARRAYS
+        self.blocks_per_number = BLOCKS_PER_GLYPH
+        self.glyph_widths = GLYPH_WIDTHS
+        (self.num_0, self.num_1, self.num_2, self.num_3, self.num_4,
+         self.num_5, self.num_6, self.num_7, self.num_8, self.num_9) = NUMBER_ARRAYS
 
     def set_num_state(self, index, value, x_shift):
         """Set the state of a digit at a given index"""
         if index < TETRIS_MAX_NUMBERS:
+            numstate = self.numstates[index]
+            numstate.outgoing_drop = None
+            if (self.clear_outgoing and 0 <= numstate.num_to_draw < 10 and numstate.blockindex > 0
+                    and 0 <= value < 10):
+                # Keep the bricks of the old number, they drop out of view before the new one falls
+                self.update_settled_layer(numstate)
+                numstate.settled, numstate.outgoing = numstate.outgoing, numstate.settled
+                numstate.outgoing_drop = 0
             self.numstates[index].num_to_draw = value
             self.numstates[index].x_shift = x_shift
             self.numstates[index].fallindex = 0
             self.numstates[index].blockindex = 0
+            self.numstates[index].settled.reset()
+            self.numstates[index].timeline = None
+            self.numstates[index].placed = None
+            self.numstates[index].step_time = None
 
     def set_time(self, time_str, force_refresh=False):
-        """Set the time to display (format: "12:34")"""
-        self.sizeOfValue = 4
+        """Set the time to display (format: "12:34" or "12:34:56")"""
         time_str = time_str.replace(":", "")
-        for pos in range(4):
-            x_offset = pos * TETRIS_DISTANCE_BETWEEN_DIGITS * self.scale
-            if pos >= 2:
-                x_offset += (3 * self.scale)
+        self.sizeOfValue = 6 if len(time_str) > 4 else 4
+        for pos in range(self.sizeOfValue):
+            # Every pair of digits after the first leaves room for a colon
+            x_offset = pos * TETRIS_DISTANCE_BETWEEN_DIGITS * self.scale + (pos // 2) * 3 * self.scale
             
             individual_number = time_str[pos] if pos < len(time_str) else " "
             number = int(individual_number) if individual_number.isdigit() else -1
@@ -231,161 +740,143 @@ class TetrisMatrixDraw:
             if force_refresh or number != self.numstates[pos].num_to_draw:
                 self.set_num_state(pos, number, x_offset)
 
+    def clear(self):
+        """Clear the frame that is being drawn"""
+        self.canvas.Clear()
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget what is on the canvas, so the next update_numbers repaints everything"""
+        self.damage = None
+        self._scene = {}
+        self._full_damage = True
+
+    def clip_bounds(self):
+        """Return the (x0, y0, x1, y1) rectangle drawing is limited to"""
+        if self.clip is None:
+            return (0, 0, self.canvas.width, self.canvas.height)
+        return self.clip
+
+    def flush(self):
+        """Push the drawn frame to the canvas (pixels are written directly, nothing to do)"""
+        pass
+
+    def clear_rect(self, rect):
+        """Fill an (x0, y0, x1, y1) rectangle with black, e.g. a region about to be repainted"""
+        self.fill_rect(rect[0], rect[1], rect[2] - rect[0], rect[3] - rect[1], self.tetrisBLACK)
+
     def draw_pixel(self, x, y, color):
         """Draw a single pixel on the canvas with the specified color"""
-        if 0 <= x < self.canvas.width and 0 <= y < self.canvas.height:
+        self.pixel_writes += 1
+        x0, y0, x1, y1 = self.clip_bounds()
+        if x0 <= x < x1 and y0 <= y < y1:
             self.canvas.SetPixel(x, y, color[0], color[1], color[2])
 
     def fill_rect(self, x, y, w, h, color):
         """Draw a filled rectangle"""
-        for i in range(w):
-            for j in range(h):
-                self.draw_pixel(x + i, y + j, color)
+        self.pixel_writes += w * h
+        x0, y0, x1, y1 = self.clip_bounds()
+        set_pixel = self.canvas.SetPixel
+        r, g, b = color
+        for i in range(max(x, x0), min(x + w, x1)):
+            for j in range(max(y, y0), min(y + h, y1)):
+                set_pixel(i, j, r, g, b)
 
     def draw_larger_block(self, x_pos, y_pos, scale, color):
         """Draw a scaled block"""
         self.fill_rect(x_pos, y_pos, scale, scale, color)
 
-    def draw_larger_shape(self, scale, blocktype, color, x_pos, y_pos, num_rot):
-        """Draw a scaled shape"""
-        offset1 = 1 * scale
-        offset2 = 2 * scale
-        offset3 = 3 * scale
-        
-        # Square
-        if blocktype == 0:
-            self.draw_larger_block(x_pos, y_pos, scale, color)
-            self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-            self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-            self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
+    def draw_sprite(self, sprite, x_pos, y_pos, color):
+        """Draw a precompiled sprite with its origin at the given position, culled against the clip rectangle"""
+        x0, y0, x1, y1 = self.clip_bounds()
+        left = x_pos + sprite.min_x
+        top = y_pos + sprite.min_y
+        right = x_pos + sprite.max_x
+        bottom = y_pos + sprite.max_y
+        if left >= x1 or right <= x0 or top >= y1 or bottom <= y0:
             return
         
-        # L-Shape
-        elif blocktype == 1:
-            if num_rot == 0:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset2, scale, color)
-            elif num_rot == 1:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos - offset1, scale, color)
-            elif num_rot == 2:
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset2, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset2, scale, color)
-            elif num_rot == 3:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos - offset1, scale, color)
-        
-        # L-Shape (reverse)
-        elif blocktype == 2:
-            if num_rot == 0:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset2, scale, color)
-            elif num_rot == 1:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-            elif num_rot == 2:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset2, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset2, scale, color)
-            elif num_rot == 3:
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos, scale, color)
-        
-        # I-Shape
-        elif blocktype == 3:
-            if num_rot == 0 or num_rot == 2:  # Horizontal
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset3, y_pos, scale, color)
-            else:  # Vertical
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset2, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset3, scale, color)
+        self.pixel_writes += len(sprite.pixels)
+        set_pixel = self.canvas.SetPixel
+        r, g, b = color
+        if left >= x0 and right <= x1 and top >= y0 and bottom <= y1:
+            # Fully visible, no need to check every pixel
+            for dx, dy in sprite.pixels:
+                set_pixel(x_pos + dx, y_pos + dy, r, g, b)
+            return
         
-        # S-Shape
-        elif blocktype == 4:
-            if num_rot == 0 or num_rot == 2:
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset2, scale, color)
-            else:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos - offset1, scale, color)
+        # Partly visible, only walk the visible part of each row
+        for dx, dy, n in sprite.spans:
+            y = y_pos + dy
+            if y0 <= y < y1:
+                for x in range(max(x_pos + dx, x0), min(x_pos + dx + n, x1)):
+                    set_pixel(x, y, r, g, b)
+
+    def draw_layer(self, layer, x_pos, y_pos):
+        """Draw a settled-brick raster with its origin at the given position, culled against the clip rectangle"""
+        if layer.bbox is None:
+            return
+        x0, y0, x1, y1 = self.clip_bounds()
+        left = x_pos + layer.bbox[0]
+        top = y_pos + layer.bbox[1]
+        right = x_pos + layer.bbox[2]
+        bottom = y_pos + layer.bbox[3]
+        if left >= x1 or right <= x0 or top >= y1 or bottom <= y0:
+            return
         
-        # S-Shape (reversed)
-        elif blocktype == 5:
-            if num_rot == 0 or num_rot == 2:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset2, scale, color)
-            else:
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
+        self.pixel_writes += len(layer.pixels)
+        set_pixel = self.canvas.SetPixel
+        if left >= x0 and right <= x1 and top >= y0 and bottom <= y1:
+            # Fully visible, no need to check every pixel
+            for dx, dy, r, g, b in layer.pixels:
+                set_pixel(x_pos + dx, y_pos + dy, r, g, b)
+            return
         
-        # Half cross
-        elif blocktype == 6:
-            if num_rot == 0:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-            elif num_rot == 1:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset2, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-            elif num_rot == 2:
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset2, y_pos - offset1, scale, color)
-            elif num_rot == 3:
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset2, scale, color)
+        for dx, dy, r, g, b in layer.pixels:
+            x = x_pos + dx
+            y = y_pos + dy
+            if x0 <= x < x1 and y0 <= y < y1:
+                set_pixel(x, y, r, g, b)
+
+    def draw_spans(self, spans, x_pos, y_pos, count=None):
+        """Draw the first count (x, y, length, r, g, b) spans with their origin at the given position"""
+        x0, y0, x1, y1 = self.clip_bounds()
+        set_pixel = self.canvas.SetPixel
+        written = 0
+        for dx, dy, n, r, g, b in itertools.islice(spans, count):
+            written += n
+            y = y_pos + dy
+            if y0 <= y < y1:
+                start = x_pos + dx
+                end = start + n
+                if start < x0 or end > x1:
+                    start = max(start, x0)
+                    end = min(end, x1)
+                for x in range(start, end):
+                    set_pixel(x, y, r, g, b)
+        self.pixel_writes += written
+
+    def draw_placed(self, placed, count):
+        """Draw the first count spans of a PlacedSpans"""
+        x0, y0, x1, y1 = self.clip_bounds()
+        bbox = placed.bbox
+        if bbox is None or not count or bbox[0] >= x1 or bbox[2] <= x0 or bbox[1] >= y1 or bbox[3] <= y0:
+            return
+        written = placed.ends[count]
+        self.pixel_writes += written
+        set_pixel = self.canvas.SetPixel
+        if bbox[0] >= x0 and bbox[2] <= x1 and bbox[1] >= y0 and bbox[3] <= y1:
+            # Fully visible, hand the pixels straight to SetPixel without a Python loop
+            collections.deque(itertools.starmap(set_pixel, itertools.islice(placed.pixels, written)), maxlen=0)
+            return
         
-        # Corner-Shape
-        elif blocktype == 7:
-            if num_rot == 0:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-            elif num_rot == 1:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-            elif num_rot == 2:
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
-                self.draw_larger_block(x_pos, y_pos - offset1, scale, color)
-            elif num_rot == 3:
-                self.draw_larger_block(x_pos, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos, scale, color)
-                self.draw_larger_block(x_pos + offset1, y_pos - offset1, scale, color)
+        for x, y, r, g, b in itertools.islice(placed.pixels, written):
+            if x0 <= x < x1 and y0 <= y < y1:
+                set_pixel(x, y, r, g, b)
+
+    def draw_larger_shape(self, scale, blocktype, color, x_pos, y_pos, num_rot):
+        """Draw a scaled shape"""
+        self.draw_sprite(get_sprite(blocktype, num_rot, scale), x_pos, y_pos, color)
 
     def draw_colon(self, x, y, colon_color):
         """Draw the colon for the clock display"""
@@ -393,79 +884,369 @@ class TetrisMatrixDraw:
         x_colon_pos = x + (TETRIS_DISTANCE_BETWEEN_DIGITS * 2 * self.scale)
         self.fill_rect(x_colon_pos, y + (12 * self.scale), colon_size, colon_size, colon_color)
         self.fill_rect(x_colon_pos, y + (8 * self.scale), colon_size, colon_size, colon_color)
-   
+
+    def colon_offsets(self):
+        """Return the x offsets to pass to draw_colon for the colons between the pairs of digits"""
+        return [pair * (TETRIS_DISTANCE_BETWEEN_DIGITS * 2 + 3) * self.scale
+                for pair in range((self.sizeOfValue - 1) // 2)]
+
+    def colon_bbox(self, x, y):
+        """Return the rectangle covered by the colon drawn by draw_colon"""
+        colon_size = 2 * self.scale
+        x_colon_pos = x + (TETRIS_DISTANCE_BETWEEN_DIGITS * 2 * self.scale)
+        return (x_colon_pos, y + (8 * self.scale), x_colon_pos + colon_size, y + (12 * self.scale) + colon_size)
+
+    def count_falling_bricks(self):
+        """Return the number of digits that still have a brick falling"""
+        return sum(
+            1 for numstate in self.numstates[:self.sizeOfValue]
+            if 0 <= numstate.num_to_draw < 10 and
+            numstate.blockindex < self.blocks_per_number[numstate.num_to_draw]
+        )
+
     def get_fall_instr_by_num(self, num, blockindex):
         """Return the fall instruction for a digit"""
-        if 0 <= num < 10:
+        if 0 <= num < len(self.number_arrays):
             return self.number_arrays[num][blockindex]
         return None
 
+    def update_settled_layer(self, numstate, landed=None):
+        """Composite the bricks that dropped since the last call into the number's raster
+
+        The rectangle of every brick added, relative to the number's origin,
+        is appended to landed if given.
+        """
+        layer = numstate.settled
+        if layer.scale != self.scale:
+            layer.reset(self.scale)
+        scaled_y_offset = self.scale if self.scale > 1 else 1
+        while layer.count < numstate.blockindex:
+            fallen_block = self.get_fall_instr_by_num(numstate.num_to_draw, layer.count)
+            sprite = get_sprite(fallen_block.blocktype, fallen_block.num_rot, self.scale)
+            x_pos = fallen_block.x_pos * self.scale
+            y_pos = (fallen_block.y_stop * scaled_y_offset) - scaled_y_offset
+            layer.add(sprite, x_pos, y_pos, self.tetrisColors[fallen_block.color])
+            if landed is not None:
+                landed.append(sprite_bbox(sprite, x_pos, y_pos))
+        return layer
+
+    def outgoing_offset(self, numstate):
+        """Return how many pixels a number's outgoing raster dropped"""
+        scaled_y_offset = self.scale if self.scale > 1 else 1
+        if self.smooth:
+            return int(numstate.outgoing_drop * scaled_y_offset + 1e-9)
+        return int(numstate.outgoing_drop) * scaled_y_offset
+
+    def get_falling_brick(self, numstate):
+        """Return the sprite, position and color of a number's falling brick, relative to the number's origin"""
+        current_fall = self.get_fall_instr_by_num(numstate.num_to_draw, numstate.blockindex)
+        scaled_y_offset = self.scale if self.scale > 1 else 1
+        if self.smooth:
+            pixel = int(numstate.fallindex * scaled_y_offset + 1e-9)
+        else:
+            pixel = int(numstate.fallindex) * scaled_y_offset
+        sprite, x_pos, y_pos = get_fall_path(current_fall, self.scale)[pixel]
+        return sprite, x_pos, y_pos, self.tetrisColors[current_fall.color]
+
+    def advance_number(self, numstate):
+        """Move a number's falling brick one row, or one pixel when smooth, down after a frame
+
+        A no-op with time-based progression.
+        """
+        if self.rows_per_second is None:
+            if self.smooth and self.scale > 1:
+                self.move_number(numstate, 1.0 / self.scale)
+            else:
+                self.move_number(numstate, 1)
+
+    def move_number(self, numstate, rows):
+        """Move a number's falling brick down by rows, switching to the next bricks once they stopped
+
+        A brick shows at rows 0 to y_stop, or when smooth at the pixels 0 to
+        y_stop * scale, and whatever it moves past its last position carries
+        over to the next brick. Positions are counted in steps, rows or
+        pixels, and snapped to whole steps so that adding up 1/scale rows
+        lands exactly on every pixel.
+        """
+        steps = (self.scale if self.scale > 1 else 1) if self.smooth else 1
+        if numstate.outgoing_drop is not None:
+            drop = snap_steps((numstate.outgoing_drop + rows) * steps)
+            if drop < TETRIS_Y_DROP_DEFAULT * steps:
+                numstate.outgoing_drop = drop / steps
+                return
+            # The old number left the digit area, the new one starts falling
+            rows = (drop - TETRIS_Y_DROP_DEFAULT * steps) / steps
+            numstate.outgoing_drop = None
+        position = snap_steps((numstate.fallindex + rows) * steps)
+        blocks = self.blocks_per_number[numstate.num_to_draw]
+        while numstate.blockindex < blocks:
+            current_fall = self.get_fall_instr_by_num(numstate.num_to_draw, numstate.blockindex)
+            positions = current_fall.y_stop * steps + 1
+            if position < positions:
+                numstate.fallindex = position / steps
+                return
+            position -= positions
+            numstate.blockindex += 1
+        numstate.fallindex = 0
+
+    def sync_numbers(self):
+        """Move the falling bricks by the time elapsed since the last frame (time-based progression)"""
+        if self.rows_per_second is None:
+            return
+        now = self.clock()
+        for numstate in self.numstates[:self.sizeOfValue]:
+            if 0 <= numstate.num_to_draw < 10:
+                self.sync_number(numstate, now)
+
+    def sync_number(self, numstate, now):
+        """Move a number's falling brick by the time elapsed since its last step"""
+        if numstate.blockindex < self.blocks_per_number[numstate.num_to_draw]:
+            if numstate.step_time is not None:
+                self.move_number(numstate, (now - numstate.step_time) * self.rows_per_second)
+            numstate.step_time = now
+
+    def draw_number(self, numstate, x, y):
+        """Draw a number or glyph with its origin at the given position; returns True while it animates"""
+        animating = False
+        # Drop the replaced number out of view first
+        if numstate.outgoing_drop is not None:
+            animating = True
+            self.draw_layer(numstate.outgoing, x, y + self.outgoing_offset(numstate))
+            self.advance_number(numstate)
+        # Draw falling shape
+        elif numstate.blockindex < self.blocks_per_number[numstate.num_to_draw]:
+            animating = True
+            sprite, x_pos, y_pos, color = self.get_falling_brick(numstate)
+            self.draw_sprite(sprite, x + x_pos, y + y_pos, color)
+            self.advance_number(numstate)
+        
+        # Draw already dropped shapes
+        if numstate.blockindex > 0:
+            layer = self.update_settled_layer(numstate)
+            self.draw_layer(layer, x, y)
+        return animating
+
     def draw_numbers(self, x=0, y=0, display_colon=False):
         """Draw numbers with tetris animation"""
+        # Timelines hold one frame per row, smooth moves need the live path
+        if self.timelines is not None and not self.smooth:
+            return self.play_numbers(x, y, display_colon)
+        
+        self.sync_numbers()
         finished_animating = True
         
-        scaled_y_offset = self.scale if self.scale > 1 else 1
         base_y = y - (TETRIS_Y_DROP_DEFAULT * self.scale)
         
         for numpos in range(self.sizeOfValue):
-            if self.numstates[numpos].num_to_draw >= 0 and self.numstates[numpos].num_to_draw < 10:
-                # Draw falling shape
-                if self.numstates[numpos].blockindex < self.blocks_per_number[self.numstates[numpos].num_to_draw]:
+            numstate = self.numstates[numpos]
+            if numstate.num_to_draw >= 0 and numstate.num_to_draw < 10:
+                if self.draw_number(numstate, x + numstate.x_shift, base_y):
                     finished_animating = False
-                    current_fall = self.get_fall_instr_by_num(self.numstates[numpos].num_to_draw, 
-                                                          self.numstates[numpos].blockindex)
-                    
-                    # Handle rotations
-                    rotations = current_fall.num_rot
-                    if rotations == 1:
-                        if self.numstates[numpos].fallindex < int(current_fall.y_stop / 2):
-                            rotations = 0
-                    elif rotations == 2:
-                        if self.numstates[numpos].fallindex < int(current_fall.y_stop / 3):
-                            rotations = 0
-                        elif self.numstates[numpos].fallindex < int(current_fall.y_stop / 3 * 2):
-                            rotations = 1
-                    elif rotations == 3:
-                        if self.numstates[numpos].fallindex < int(current_fall.y_stop / 4):
-                            rotations = 0
-                        elif self.numstates[numpos].fallindex < int(current_fall.y_stop / 4 * 2):
-                            rotations = 1
-                        elif self.numstates[numpos].fallindex < int(current_fall.y_stop / 4 * 3):
-                            rotations = 2
-                    
-                    color = self.tetrisColors[current_fall.color]
-               
-                    self.draw_larger_shape(
-                        self.scale,
-                        current_fall.blocktype,
-                        color,
-                        x + (current_fall.x_pos * self.scale) + self.numstates[numpos].x_shift,
-                        base_y + (self.numstates[numpos].fallindex * scaled_y_offset) - scaled_y_offset,
-                        rotations
-                    )
-                    
-                    self.numstates[numpos].fallindex += 1
-                    
-                    if self.numstates[numpos].fallindex > current_fall.y_stop:
-                        self.numstates[numpos].fallindex = 0
-                        self.numstates[numpos].blockindex += 1
+        
+        if display_colon:
+            for offset in self.colon_offsets():
+                self.draw_colon(x + offset, base_y, self.tetrisWHITE)
+        
+        return finished_animating
+
+    def set_text(self, text):
+        """Set a text of any length for draw_text; characters missing from the glyph index are left out"""
+        layout = []
+        x = 0
+        for char in text:
+            glyph = glyph_id(char)
+            if glyph is None:
+                glyph = glyph_id(char.upper())
+            if glyph is not None:
+                layout.append((x, glyph))
+                x += self.glyph_widths[glyph] + 1
+        self.text_layout = layout
+        self.text_width = max(x - 1, 0)
+        self.text_states = {}
+        self.text_scroll = 0
+        self._text_starts = [glyph_x for glyph_x, _ in layout]
+        self._text_max_width = max((self.glyph_widths[glyph] for _, glyph in layout), default=0)
+
+    def scroll_text(self, pixels):
+        """Scroll the text to the left; once it scrolled past its own width it comes back in from the right edge"""
+        self.text_scroll += pixels
+        if self.text_scroll >= self.text_width * self.scale:
+            self.text_scroll -= self.text_width * self.scale + self.canvas.width
+
+    def draw_text(self, x=0, y=0):
+        """Draw the text set by set_text with its left edge at x - text_scroll
+
+        Only the glyphs overlapping the clip rectangle are animated and
+        drawn. Their state is created when they scroll into view and dropped
+        when they leave it, so the cost of a frame does not grow with the
+        length of the text. Returns True once the visible glyphs settled.
+        """
+        finished_animating = True
+        scale = self.scale
+        base_y = y - (TETRIS_Y_DROP_DEFAULT * scale)
+        origin_x = x - int(self.text_scroll)
+        clip_x0, _, clip_x1, _ = self.clip_bounds()
+        now = self.clock() if self.rows_per_second is not None else None
+        
+        # Glyphs starting further left than the widest glyph is wide cannot be in view
+        first = bisect.bisect_right(self._text_starts, (clip_x0 - origin_x) / scale - self._text_max_width)
+        states = {}
+        for index in range(first, len(self.text_layout)):
+            glyph_x, glyph = self.text_layout[index]
+            left = origin_x + glyph_x * scale
+            if left >= clip_x1:
+                break
+            if left + self.glyph_widths[glyph] * scale <= clip_x0:
+                continue
+            numstate = self.text_states.get(index)
+            if numstate is None:
+                numstate = NumState()
+                numstate.num_to_draw = glyph
+            states[index] = numstate
+            if now is not None:
+                self.sync_number(numstate, now)
+            if self.draw_number(numstate, left, base_y):
+                finished_animating = False
+        self.text_states = states
+        
+        return finished_animating
+
+    def play_numbers(self, x=0, y=0, display_colon=False):
+        """Draw numbers by replaying their compiled timelines instead of computing the geometry"""
+        self.sync_numbers()
+        finished_animating = True
+        
+        base_y = y - (TETRIS_Y_DROP_DEFAULT * self.scale)
+        
+        for numpos in range(self.sizeOfValue):
+            numstate = self.numstates[numpos]
+            if numstate.num_to_draw >= 0 and numstate.num_to_draw < 10:
+                timeline = numstate.timeline
+                if timeline is None or timeline.scale != self.scale:
+                    timeline = self.timelines.get(self.number_arrays[numstate.num_to_draw], self.scale,
+                                                  self.tetrisColors)
+                    numstate.timeline = timeline
                 
-                # Draw already dropped shapes
-                if self.numstates[numpos].blockindex > 0:
-                    for i in range(self.numstates[numpos].blockindex):
-                        fallen_block = self.get_fall_instr_by_num(self.numstates[numpos].num_to_draw, i)
-                        color = self.tetrisColors[fallen_block.color]
-                        
-                        self.draw_larger_shape(
-                            self.scale,
-                            fallen_block.blocktype, 
-                            color,
-                            x + (fallen_block.x_pos * self.scale) + self.numstates[numpos].x_shift,
-                            base_y + (fallen_block.y_stop * scaled_y_offset) - scaled_y_offset,
-                            fallen_block.num_rot
-                        )
+                falling, settled_count = timeline.frame_at(numstate.blockindex, int(numstate.fallindex))
+                origin_x = x + numstate.x_shift
+                placed = numstate.placed
+                if placed is None or placed.timeline is not timeline or placed.x != origin_x or placed.y != base_y:
+                    placed = numstate.placed = PlacedSpans(timeline, origin_x, base_y)
+                if numstate.outgoing_drop is not None:
+                    finished_animating = False
+                    self.draw_layer(numstate.outgoing, origin_x, base_y + self.outgoing_offset(numstate))
+                    self.advance_number(numstate)
+                elif falling is not None:
+                    finished_animating = False
+                    self.draw_spans(falling, origin_x, base_y)
+                    self.advance_number(numstate)
+                self.draw_placed(placed, settled_count)
+        
+        if display_colon:
+            for offset in self.colon_offsets():
+                self.draw_colon(x + offset, base_y, self.tetrisWHITE)
+        
+        return finished_animating
+
+    def update_numbers(self, x=0, y=0, display_colon=False):
+        """Advance the animation like draw_numbers, but only repaint the regions that changed
+
+        Relies on the canvas keeping its content between frames. With
+        buffer_count canvases rotating through the display, the canvas being
+        drawn is buffer_count - 1 frames behind, so the regions that changed
+        in those frames are repainted too. The repainted
+        rectangles are left in self.damage; an empty list means that neither
+        buffer needs to change.
+        """
+        self.sync_numbers()
+        finished_animating = True
+        
+        base_y = y - (TETRIS_Y_DROP_DEFAULT * self.scale)
+        
+        # Collect everything this frame consists of as (draw method name, args, bbox)
+        scene = {}
+        damage = []
+        for numpos in range(self.sizeOfValue):
+            numstate = self.numstates[numpos]
+            if numstate.num_to_draw >= 0 and numstate.num_to_draw < 10:
+                if numstate.outgoing_drop is not None:
+                    finished_animating = False
+                    layer = numstate.outgoing
+                    origin_x = x + numstate.x_shift
+                    origin_y = base_y + self.outgoing_offset(numstate)
+                    scene[("outgoing", numpos)] = ("draw_layer", (layer, origin_x, origin_y),
+                                                   (layer.bbox[0] + origin_x, layer.bbox[1] + origin_y,
+                                                    layer.bbox[2] + origin_x, layer.bbox[3] + origin_y))
+                    self.advance_number(numstate)
+                elif numstate.blockindex < self.blocks_per_number[numstate.num_to_draw]:
+                    finished_animating = False
+                    sprite, x_pos, y_pos, color = self.get_falling_brick(numstate)
+                    x_pos += x + numstate.x_shift
+                    y_pos += base_y
+                    scene[("brick", numpos)] = ("draw_sprite", (sprite, x_pos, y_pos, color),
+                                                sprite_bbox(sprite, x_pos, y_pos))
+                    self.advance_number(numstate)
+                
+                # The layer keeps its identity while it grows, so the bricks that
+                # just landed are damaged on their own. With time-based steps or
+                # smooth moves a brick may land without ever being drawn at its
+                # last row, so the falling brick's rectangle does not cover it.
+                if numstate.blockindex > 0:
+                    landed = []
+                    layer = self.update_settled_layer(numstate, landed)
+                    origin_x = x + numstate.x_shift
+                    damage.extend((x0 + origin_x, y0 + base_y, x1 + origin_x, y1 + base_y)
+                                  for x0, y0, x1, y1 in landed)
+                    scene[("layer", numpos)] = ("draw_layer", (layer, origin_x, base_y),
+                                                (layer.bbox[0] + origin_x, layer.bbox[1] + base_y,
+                                                 layer.bbox[2] + origin_x, layer.bbox[3] + base_y))
         
         if display_colon:
-            self.draw_colon(x, base_y, self.tetrisWHITE)
+            for offset in self.colon_offsets():
+                scene[("colon", offset)] = ("draw_colon", (x + offset, base_y, self.tetrisWHITE),
+                                            self.colon_bbox(x + offset, base_y))
         
+        self.repaint_scene(scene, damage)
         return finished_animating
+
+    def repaint_scene(self, scene, damage):
+        """Repaint the regions of a scene of key: (draw method name, args, bbox) that changed since the last one
+
+        The old and new rectangles of the entries whose draw or args changed
+        are added to the given damage rectangles, and the damage of the frames
+        the canvas is behind is repainted along with them. Draw methods are
+        looked up by name, so wrapping them on the instance, e.g. while
+        profiling, does not make every entry look changed.
+        """
+        # Damage the old and new rectangles of everything that changed
+        if self._full_damage:
+            damage.append((0, 0, self.canvas.width, self.canvas.height))
+            self._full_damage = False
+        for key in set(scene) | set(self._scene):
+            old = self._scene.get(key)
+            new = scene.get(key)
+            if old is not None and new is not None and old[:2] == new[:2]:
+                continue
+            if old is not None:
+                damage.append(old[2])
+            if new is not None:
+                damage.append(new[2])
+        
+        history = self._damage_history
+        if history.maxlen != self.buffer_count - 1:
+            history = self._damage_history = collections.deque(history, maxlen=self.buffer_count - 1)
+        canvas_rect = (0, 0, self.canvas.width, self.canvas.height)
+        repaint = merge_rects(rect for rect in (intersect_rects(r, canvas_rect)
+                                                for r in itertools.chain(damage, *history))
+                              if rect is not None)
+        history.append(damage)
+        self._scene = scene
+        
+        for rect in repaint:
+            self.clip = rect
+            self.clear_rect(rect)
+            for draw, args, bbox in scene.values():
+                if bbox[0] < rect[2] and rect[0] < bbox[2] and bbox[1] < rect[3] and rect[1] < bbox[3]:
+                    getattr(self, draw)(*args)
+        self.clip = None
+        self.damage = repaint
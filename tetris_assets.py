@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""Cache the glyph tables and compiled digit timelines in a file that later starts map instead of computing"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+from tetris_animation import (GLYPH_ARRAYS, GLYPH_BITMAPS, GLYPH_INDEX, GLYPH_SHAPE_ORDER, GLYPH_TILING_BUDGET,
+                              GLYPH_WIDTHS, NUMBER_ARRAYS, TETRIS_COLORS, DigitTimeline, FallInstruction,
+                              compile_timeline, glyph_id, register_glyph)
+
+ASSET_MAGIC = b"TTAS"
+ASSET_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "tetris-clock")
+# magic, version, scale, panel width, panel height, checksum of the source tables, glyphs, timelines
+HEADER = struct.Struct("<4sHHHHIHH")
+# Per glyph: character, width in blocks, number of fall instructions
+GLYPH_ENTRY = struct.Struct("<IHH")
+# blocktype, color, x_pos, y_stop, num_rot
+INSTRUCTION = struct.Struct("<BBhBB")
+# Per timeline: bricks + 1 frame starts, frames, settled spans, falling spans
+TIMELINE_ENTRY = struct.Struct("<HHII")
+FRAME_START = struct.Struct("<H")
+# Per frame: index of its first falling span, number of falling spans, number of settled spans
+FRAME = struct.Struct("<IHH")
+# x, y relative to the number origin, length, color
+RUN = struct.Struct("<hhHBBB")
+
+
+def asset_path(cache_dir, scale, width, height):
+    """Return the cache file for a scale and panel size"""
+    return os.path.join(cache_dir, "assets-%d-%dx%d.bin" % (scale, width, height))
+
+
+def source_checksum(colors):
+    """Checksum of everything the cached assets are computed from, a changed table makes the file stale"""
+    source = repr((
+        sorted(GLYPH_BITMAPS.items()), GLYPH_SHAPE_ORDER, GLYPH_TILING_BUDGET, tuple(colors),
+        [[(f.blocktype, f.color, f.x_pos, f.y_stop, f.num_rot) for f in number_array]
+         for number_array in NUMBER_ARRAYS],
+    ))
+    return zlib.crc32(source.encode())
+
+
+def pack_assets(scale, width, height, colors):
+    """Stack all glyphs, compile all digit timelines and return them in the cache file layout"""
+    chars = list(GLYPH_BITMAPS)
+    parts = [HEADER.pack(ASSET_MAGIC, ASSET_VERSION, scale, width, height, source_checksum(colors),
+                         len(chars), len(NUMBER_ARRAYS))]
+    for char in chars:
+        glyph = glyph_id(char)
+        instructions = GLYPH_ARRAYS[glyph]
+        parts.append(GLYPH_ENTRY.pack(ord(char), GLYPH_WIDTHS[glyph], len(instructions)))
+        parts.extend(INSTRUCTION.pack(f.blocktype, f.color, f.x_pos, f.y_stop, f.num_rot) for f in instructions)
+
+    for number_array in NUMBER_ARRAYS:
+        timeline = compile_timeline(number_array, scale, colors)
+        frames = []
+        falling_spans = []
+        for falling, settled_count in timeline.frames:
+            falling = falling or ()
+            frames.append(FRAME.pack(len(falling_spans), len(falling), settled_count))
+            falling_spans.extend(falling)
+        parts.append(TIMELINE_ENTRY.pack(len(timeline.start), len(frames), len(timeline.settled),
+                                         len(falling_spans)))
+        parts.extend(FRAME_START.pack(start) for start in timeline.start)
+        parts.extend(frames)
+        parts.extend(RUN.pack(*span) for span in timeline.settled)
+        parts.extend(RUN.pack(*span) for span in falling_spans)
+    return b"".join(parts)
+
+
+def write_assets(path, scale, width, height, colors=TETRIS_COLORS):
+    """Compute the assets and atomically write them to path; returns False if the directory is not writable"""
+    import tempfile
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Find out whether the directory is writable before spending time on the assets
+        fd, tmp_path = tempfile.mkstemp(prefix=".assets-", dir=os.path.dirname(path) or ".")
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pack_assets(scale, width, height, colors))
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+class MappedDigitTimeline(DigitTimeline):
+    """DigitTimeline whose falling-brick spans stay in the mapped file until a frame is drawn"""
+    def __init__(self, scale, buffer, frames_offset, spans_offset, start, settled):
+        super().__init__(scale)
+        self.start = start
+        self.settled = settled
+        self.nbytes = len(start) * 8 + len(settled) * RUN.size
+        self._buffer = buffer
+        self._frames_offset = frames_offset
+        self._spans_offset = spans_offset
+
+    def frame_at(self, blockindex, fallindex):
+        """Return the frame drawn while brick blockindex is at row fallindex"""
+        frame = self.start[blockindex] + fallindex
+        first, count, settled_count = FRAME.unpack_from(self._buffer, self._frames_offset + frame * FRAME.size)
+        if not count:
+            return None, settled_count
+        offset = self._spans_offset + first * RUN.size
+        return RUN.iter_unpack(self._buffer[offset:offset + count * RUN.size]), settled_count
+
+
+class AssetCache:
+    """A mapped asset cache file"""
+    def __init__(self, path, scale, width, height, colors=TETRIS_COLORS):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._mmap)
+        if len(self.buffer) < HEADER.size:
+            self.close()
+            raise ValueError("%s is not an asset cache" % path)
+        header = HEADER.unpack_from(self.buffer)
+        if header[:6] != (ASSET_MAGIC, ASSET_VERSION, scale, width, height, source_checksum(colors)):
+            self.close()
+            raise ValueError("%s is stale" % path)
+        self.scale = scale
+        self.colors = colors
+
+        offset = HEADER.size
+        self.glyphs = []           # (character, fall instructions, width) of every glyph
+        for _ in range(header[6]):
+            codepoint, glyph_width, count = GLYPH_ENTRY.unpack_from(self.buffer, offset)
+            offset += GLYPH_ENTRY.size
+            instructions = tuple(FallInstruction(*fields) for fields in
+                                 INSTRUCTION.iter_unpack(self.buffer[offset:offset + count * INSTRUCTION.size]))
+            offset += count * INSTRUCTION.size
+            self.glyphs.append((chr(codepoint), instructions, glyph_width))
+
+        self.timelines = []        # MappedDigitTimeline of every number
+        for _ in range(header[7]):
+            start_count, frame_count, settled_count, falling_count = TIMELINE_ENTRY.unpack_from(self.buffer, offset)
+            offset += TIMELINE_ENTRY.size
+            start = [fields[0] for fields in
+                     FRAME_START.iter_unpack(self.buffer[offset:offset + start_count * FRAME_START.size])]
+            offset += start_count * FRAME_START.size
+            frames_offset = offset
+            offset += frame_count * FRAME.size
+            settled = list(RUN.iter_unpack(self.buffer[offset:offset + settled_count * RUN.size]))
+            offset += settled_count * RUN.size
+            self.timelines.append(MappedDigitTimeline(scale, self.buffer, frames_offset, offset, start, settled))
+            offset += falling_count * RUN.size
+
+    def install(self, tetris):
+        """Register the glyphs not defined otherwise, and seed the timeline cache of a TetrisMatrixDraw if it has one"""
+        for char, instructions, glyph_width in self.glyphs:
+            if char not in GLYPH_INDEX:
+                register_glyph(char, instructions, glyph_width)
+        if (tetris.timelines is not None and tetris.scale == self.scale
+                and tuple(tetris.tetrisColors) == tuple(self.colors)):
+            for number_array, timeline in zip(NUMBER_ARRAYS, self.timelines):
+                tetris.timelines.add(number_array, self.scale, self.colors, timeline)
+
+    def close(self):
+        """Unmap the file; the timelines must not be used afterwards"""
+        self.buffer.release()
+        self._mmap.close()
+
+
+def load_assets(cache_dir, scale, width, height, colors=TETRIS_COLORS):
+    """Map the asset cache for a scale and panel size, writing it first if it is missing or stale
+
+    Returns None if there is no usable cache file and none can be written,
+    e.g. on a read-only filesystem; everything is then computed as needed.
+    """
+    path = asset_path(cache_dir, scale, width, height)
+    for attempt in range(2):
+        try:
+            return AssetCache(path, scale, width, height, colors)
+        except (OSError, ValueError):
+            if attempt or not write_assets(path, scale, width, height, colors):
+                return None
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cache-dir", action="store", default=DEFAULT_CACHE_DIR,
+                        help="Directory of the cache files (default: %s)" % DEFAULT_CACHE_DIR)
+    parser.add_argument("--scale", action="store", type=int, default=2, help="Clock scale (default: 2)")
+    parser.add_argument("--width", action="store", type=int, default=64, help="Panel width (default: 64)")
+    parser.add_argument("--height", action="store", type=int, default=32, help="Panel height (default: 32)")
+    args = parser.parse_args(argv)
+
+    path = asset_path(args.cache_dir, args.scale, args.width, args.height)
+    start = time.perf_counter()
+    if not write_assets(path, args.scale, args.width, args.height):
+        print("Could not write %s" % path, file=sys.stderr)
+        return 1
+    written = time.perf_counter() - start
+    start = time.perf_counter()
+    assets = AssetCache(path, args.scale, args.width, args.height)
+    print("Wrote %s, %d bytes in %.1f ms; mapping it takes %.1f ms" % (
+        path, os.path.getsize(path), written * 1000, (time.perf_counter() - start) * 1000))
+    assets.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
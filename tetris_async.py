@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+import asyncio
+import concurrent.futures
+import time
+
+
+class AsyncClockRunner:
+    """Runs the render loop of a TetrisClock as an asyncio task
+
+    Rendering happens on the event loop, so the control methods need no
+    locking as long as they are called from the loop. SwapOnVSync blocks
+    until the next vsync, so it runs on a single worker thread instead. A
+    cancelled runner waits for a swap in flight to finish before it returns,
+    so the clock never loses track of which canvas it draws into.
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="tetris-swap")
+        self._running = asyncio.Event()  # Cleared while paused
+        self._running.set()
+        self._wake = asyncio.Event()  # Cuts a frame wait short after a control call
+
+    def set_text(self, text):
+        """Show a text instead of the time, see TetrisClock.set_text; None goes back to the time"""
+        self.clock.set_text(text)
+        self._wake.set()
+
+    def set_fps(self, fps):
+        """Change the frame rate of the animation"""
+        self.clock.scheduler.set_fps(fps)
+        self._wake.set()
+
+    def pause(self):
+        """Stop rendering, the display keeps showing the last frame"""
+        self._running.clear()
+
+    def resume(self):
+        """Continue rendering after pause"""
+        self._running.set()
+        self._wake.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    async def _sleep(self, seconds):
+        """Sleep, waking up early when a control call wants a new frame"""
+        try:
+            await asyncio.wait_for(self._wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    async def swap(self):
+        """Swap the drawn and pushed frame onto the matrix without blocking the loop"""
+        clock = self.clock
+        loop = asyncio.get_running_loop()
+        swap_start = time.perf_counter()
+        future = loop.run_in_executor(self.executor, clock.matrix.SwapOnVSync, clock.offscreen_canvas)
+        try:
+            canvas = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The swap carries on in the executor; take the canvas it hands back before leaving
+            clock.offscreen_canvas = await future
+            clock.tetris.canvas = clock.offscreen_canvas
+            raise
+        clock.offscreen_canvas = canvas
+        clock.tetris.canvas = canvas
+        return time.perf_counter() - swap_start
+
+    async def run(self):
+        """Render and swap frames until cancelled"""
+        clock = self.clock
+        try:
+            while True:
+                await self._running.wait()
+                render_start = time.perf_counter()
+                changed = clock.render_frame()
+                if changed:
+                    clock.tetris.flush()
+                render_time = time.perf_counter() - render_start
+                swap_time = await self.swap() if changed else None
+                clock.metrics.record_frame(clock.tetris, render_time, swap_time,
+                                           clock.animation_active, clock.scheduler)
+                if swap_time is not None and clock.metrics.startup_seconds is None:
+                    clock.report_startup()
+
+                clock.export_metrics()
+                deadline = clock.idle_deadline()
+                if deadline is None:
+                    await clock.scheduler.wait_frame_async(self._sleep)
+                else:
+                    await clock.scheduler.sleep_until_async(deadline, self._sleep)
+        finally:
+            self.executor.shutdown(wait=True)
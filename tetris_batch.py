@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""Render the whole animations of many time strings or texts offline, e.g. a preview of every minute of a day"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tetris_animation import NumState, TETRIS_Y_DROP_DEFAULT
+from tetris_numpy import NumpyTetrisMatrixDraw
+from tetris_virtual import VirtualCanvas
+
+GLYPH_MARGIN = 4               # Blocks around a glyph its bricks may reach while falling and rotating
+
+
+class GlyphFrames:
+    """Every frame of one glyph's animation, cropped to the pixels it ever covers"""
+    def __init__(self, frames, x, y):
+        self.frames = frames       # (n, h, w, 3) uint8 frames, the last one shows the settled glyph
+        # 0 where a frame draws a pixel and 255 where it leaves the one below, black pixels are not drawn
+        self.keep = np.repeat(np.where(frames.any(axis=3, keepdims=True), 0, 255).astype(np.uint8), 3, axis=3)
+        self.x = x                 # Left edge relative to the glyph origin
+        self.y = y                 # Top edge relative to the glyph origin
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class BatchRenderer:
+    """Renders the whole animation of a time string or a text as one (frames, height, width, 3) array
+
+    Every glyph is animated once, on its own, and its frames are kept. The
+    frames of a string are then put together by indexing the frame stacks of
+    its glyphs with the frame numbers and masking them into place, two
+    vectorized byte operations per glyph for all frames at once. The result
+    matches clearing the canvas and calling draw_numbers (or draw_text with
+    text=True) until the animation finished.
+    """
+    def __init__(self, scale=2, width=64, height=32, x=None, y=None, colon=True, smooth=False, text=False):
+        self.options = dict(scale=scale, width=width, height=height, x=x, y=y, colon=colon, smooth=smooth, text=text)
+        self.scale = scale
+        self.width = width
+        self.height = height
+        self.x = x if x is not None else (0 if text else 2)
+        self.y = y if y is not None else 13 * scale
+        self.colon = colon
+        self.smooth = smooth
+        self.text = text           # Render strings with set_text/draw_text instead of set_time/draw_numbers
+        # Lays the strings out and draws the colons, it never animates
+        self.layout = NumpyTetrisMatrixDraw(VirtualCanvas(width, height))
+        self.layout.scale = scale
+        self._glyphs = {}          # Glyph id -> GlyphFrames
+        self._colons = {}          # Number of digits -> (colon pixels, keep mask)
+
+    def glyph_frames(self, glyph):
+        """Return the GlyphFrames of a glyph id, animating it the first time"""
+        frames = self._glyphs.get(glyph)
+        if frames is None:
+            frames = self._glyphs[glyph] = self._animate(glyph)
+        return frames
+
+    def _animate(self, glyph):
+        scale = self.scale
+        margin = GLYPH_MARGIN * scale
+        canvas = VirtualCanvas((self.layout.glyph_widths[glyph] + 2 * GLYPH_MARGIN) * scale,
+                               (TETRIS_Y_DROP_DEFAULT + 2 * GLYPH_MARGIN) * scale)
+        tetris = NumpyTetrisMatrixDraw(canvas)
+        tetris.scale = scale
+        tetris.smooth = self.smooth
+        numstate = NumState()
+        numstate.num_to_draw = glyph
+        frames = []
+        animating = True
+        while animating:
+            tetris.clear()
+            animating = tetris.draw_number(numstate, margin, margin)
+            frames.append(tetris.frame.copy())
+        frames = np.stack(frames)
+
+        covered = frames.any(axis=(0, 3))
+        rows = np.flatnonzero(covered.any(axis=1))
+        cols = np.flatnonzero(covered.any(axis=0))
+        if not len(rows):
+            return GlyphFrames(frames[:, :0, :0], 0, 0)
+        y0, y1 = rows[0], rows[-1] + 1
+        x0, x1 = cols[0], cols[-1] + 1
+        return GlyphFrames(np.ascontiguousarray(frames[:, y0:y1, x0:x1]), x0 - margin, y0 - margin)
+
+    def placements(self, text):
+        """Return the (left, top, GlyphFrames) of every glyph of a string that shows on the panel"""
+        layout = self.layout
+        base_y = self.y - TETRIS_Y_DROP_DEFAULT * self.scale
+        if self.text:
+            layout.set_text(text)
+            origins = [(self.x + glyph_x * self.scale, glyph) for glyph_x, glyph in layout.text_layout]
+        else:
+            layout.set_time(text, True)
+            origins = [(self.x + numstate.x_shift, numstate.num_to_draw)
+                       for numstate in layout.numstates[:layout.sizeOfValue] if 0 <= numstate.num_to_draw < 10]
+
+        placed = []
+        for x, glyph in origins:
+            # draw_text leaves out the glyphs outside the panel, draw_numbers animates every digit
+            if self.text and (x >= self.width or x + layout.glyph_widths[glyph] * self.scale <= 0):
+                continue
+            frames = self.glyph_frames(glyph)
+            placed.append((x + frames.x, base_y + frames.y, frames))
+        return placed
+
+    def frame_count(self, text):
+        """Return the number of frames of a string's animation, including the settled last one"""
+        return max((len(frames) for _, _, frames in self.placements(text)), default=1)
+
+    def _colon_overlay(self):
+        """Return the colon pixels and mask for the digits laid out last"""
+        layout = self.layout
+        overlay = self._colons.get(layout.sizeOfValue)
+        if overlay is None:
+            layout.clear()
+            base_y = self.y - TETRIS_Y_DROP_DEFAULT * self.scale
+            for offset in layout.colon_offsets():
+                layout.draw_colon(self.x + offset, base_y, layout.tetrisWHITE)
+            pixels = layout.frame.copy()
+            keep = np.repeat(np.where(pixels.any(axis=2, keepdims=True), 0, 255).astype(np.uint8), 3, axis=2)
+            overlay = self._colons[layout.sizeOfValue] = (pixels, keep)
+        return overlay
+
+    def render(self, text):
+        """Return every frame of a string's animation as a (frames, height, width, 3) uint8 array"""
+        placed = self.placements(text)
+        count = max((len(frames) for _, _, frames in placed), default=1)
+        out = np.zeros((count, self.height, self.width, 3), dtype=np.uint8)
+        steps = np.arange(count)
+        for left, top, frames in placed:
+            h, w = frames.frames.shape[1:3]
+            x0, y0 = max(left, 0), max(top, 0)
+            x1, y1 = min(left + w, self.width), min(top + h, self.height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            # A settled glyph keeps showing its last frame
+            index = np.minimum(steps, len(frames) - 1)
+            region = (slice(None), slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+            target = out[:, y0:y1, x0:x1]
+            target &= frames.keep[region][index]
+            target |= frames.frames[region][index]
+        if self.colon and not self.text:
+            pixels, keep = self._colon_overlay()
+            out &= keep
+            out |= pixels
+        return out
+
+    def render_batch(self, texts, workers=1, path=None):
+        """Render many strings into one array; returns it and the index of the first frame of every string
+
+        The last index is the total number of frames. With a path the array
+        is a .npy file mapped into memory, so it may be larger than the RAM.
+        Worker processes write their frames straight into the array.
+        """
+        starts = [0]
+        for text in texts:
+            starts.append(starts[-1] + self.frame_count(text))
+        shape = (starts[-1], self.height, self.width, 3)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(texts)))
+        shm = None
+        if path is not None:
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=shape)
+            target = ("file", path, shape)
+        elif workers > 1:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape))))
+            out = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            target = ("shm", shm.name, shape)
+        else:
+            out = np.empty(shape, dtype=np.uint8)
+
+        try:
+            if workers == 1:
+                for index, text in enumerate(texts):
+                    out[starts[index]:starts[index + 1]] = self.render(text)
+            else:
+                with multiprocessing.Pool(workers, _init_worker, (self.options, target)) as pool:
+                    jobs = list(zip(texts, starts))
+                    for _ in pool.imap_unordered(_render_worker, jobs, _chunksize(len(jobs), workers)):
+                        pass
+            if shm is not None:
+                out = out.copy()
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        if path is not None:
+            out.flush()
+        return out, starts
+
+    def iter_frames(self, texts, workers=None):
+        """Yield (text, frames) for every string in order, rendered by a pool of worker processes
+
+        workers defaults to one per core; with 1 everything is rendered in this process.
+        """
+        workers = max(1, min(workers or os.cpu_count() or 1, len(texts)))
+        if workers == 1:
+            for text in texts:
+                yield text, self.render(text)
+            return
+        with multiprocessing.Pool(workers, _init_worker, (self.options, None)) as pool:
+            jobs = [(text, None) for text in texts]
+            for text, frames in zip(texts, pool.imap(_render_worker, jobs, _chunksize(len(jobs), workers))):
+                yield text, frames
+
+
+def _chunksize(jobs, workers):
+    return max(1, min(16, jobs // (workers * 4)))
+
+
+_worker_renderer = None        # BatchRenderer of a pool worker process
+_worker_out = None             # Array the worker writes frames into, None to send them back
+_worker_shm = None             # Shared memory behind _worker_out, kept open while the worker lives
+
+
+def _init_worker(options, target):
+    global _worker_renderer, _worker_out, _worker_shm
+    _worker_renderer = BatchRenderer(**options)
+    if target is None:
+        return
+    kind, name, shape = target
+    if kind == "file":
+        _worker_out = np.load(name, mmap_mode="r+")
+    else:
+        _worker_shm = shared_memory.SharedMemory(name=name)
+        _worker_out = np.ndarray(shape, dtype=np.uint8, buffer=_worker_shm.buf)
+
+
+def _render_worker(job):
+    text, start = job
+    frames = _worker_renderer.render(text)
+    if _worker_out is None:
+        return frames
+    _worker_out[start:start + len(frames)] = frames
+    return None
+
+
+def day_times(step=1, seconds=False):
+    """Return the time strings of a whole day, every step minutes (or seconds with seconds=True)"""
+    if seconds:
+        return ["%02d:%02d:%02d" % (t // 3600, t // 60 % 60, t % 60) for t in range(0, 24 * 3600, step)]
+    return ["%02d:%02d" % (t // 60, t % 60) for t in range(0, 24 * 60, step)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("texts", nargs="*", help="Time strings to render, or texts with --text")
+    parser.add_argument("--day", action="store_true", help="Render every minute of a day")
+    parser.add_argument("--step", action="store", type=int, default=1,
+                        help="With --day, minutes between the rendered times (default: 1)")
+    parser.add_argument("--text", action="store_true", help="Render the strings as text like --message does")
+    parser.add_argument("--scale", action="store", type=int, default=2, help="Clock scale (default: 2)")
+    parser.add_argument("--width", action="store", type=int, default=64, help="Frame width (default: 64)")
+    parser.add_argument("--height", action="store", type=int, default=32, help="Frame height (default: 32)")
+    parser.add_argument("--smooth", action="store_true", help="Move bricks pixel by pixel")
+    parser.add_argument("--no-colon", action="store_true", help="Leave out the colon")
+    parser.add_argument("--workers", action="store", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("-o", "--output", action="store", default="-",
+                        help="Where to write the frames: a .npy file holds one (frames, height, width, 3) "
+                             "array, anything else gets raw RGB24 frames (default: - for stdout)")
+    args = parser.parse_args(argv)
+
+    texts = list(args.texts)
+    if args.day:
+        texts += day_times(args.step)
+    if not texts:
+        parser.error("nothing to render, give time strings or --day")
+
+    renderer = BatchRenderer(args.scale, args.width, args.height, colon=not args.no_colon,
+                             smooth=args.smooth, text=args.text)
+    start = time.perf_counter()
+    if args.output.endswith(".npy"):
+        # The frames of a whole day need not fit into memory, the workers write into the mapped file
+        out, starts = renderer.render_batch(texts, args.workers, args.output)
+        total = starts[-1]
+        del out
+    else:
+        stream = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        total = 0
+        try:
+            for _, frames in renderer.iter_frames(texts, args.workers):
+                stream.write(frames.tobytes())
+                total += len(frames)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+    print("Rendered %d strings, %d frames of %dx%d in %.2f s" % (
+        len(texts), total, args.width, args.height, time.perf_counter() - start), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
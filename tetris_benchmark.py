@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""Benchmark the tetris render path on a virtual matrix, without any LED hardware"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from tetris_animation import TetrisMatrixDraw, TimelineCache
+from tetris_virtual import VirtualMatrix
+
+IDLE_FRAMES = 20
+VERIFY_FPS = 23                # Frame rate simulated by --verify, not a divisor of the drop speeds
+VERIFY_ROWS_PER_SECOND = (None, 17, 45)  # Drop speeds checked by --verify, None for one row per frame
+
+
+def transitions():
+    """Return the time strings that make every digit animate in every position"""
+    return ["%d%d:%d%d" % ((d,) * 4) for d in range(10)]
+
+
+def create_drawer(backend, canvas):
+    """Create a drawer for the given backend name"""
+    if backend == "numpy":
+        from tetris_numpy import NumpyTetrisMatrixDraw
+        return NumpyTetrisMatrixDraw(canvas)
+    return TetrisMatrixDraw(canvas)
+
+
+def run_case(scale, width, height, mode, backend):
+    """Render all transitions once and return (frames, elapsed ns, SetPixel calls, bulk writes)"""
+    matrix = VirtualMatrix(width, height)
+    canvas = matrix.CreateFrameCanvas()
+    tetris = create_drawer(backend, canvas)
+    tetris.scale = scale
+    if mode == "timeline":
+        tetris.timelines = TimelineCache()
+    canvases = [canvas, matrix.front]
+
+    frames = 0
+    elapsed = 0
+    for time_str in transitions():
+        tetris.set_time(time_str, True)
+        idle = 0
+        while idle < IDLE_FRAMES:
+            show_colon = (frames // 10) % 2 == 0
+            start = time.perf_counter_ns()
+            if mode == "dirty":
+                finished = tetris.update_numbers(2, 13 * scale, show_colon)
+                changed = bool(tetris.damage)
+            else:
+                tetris.clear()
+                finished = tetris.draw_numbers(2, 13 * scale, show_colon)
+                changed = True
+            if changed:
+                tetris.flush()
+                tetris.canvas = matrix.SwapOnVSync(tetris.canvas)
+            elapsed += time.perf_counter_ns() - start
+            frames += 1
+            if finished:
+                idle += 1
+
+    set_pixel_calls = sum(c.set_pixel_calls for c in canvases)
+    bulk_writes = sum(c.bulk_writes for c in canvases)
+    return frames, elapsed, set_pixel_calls, bulk_writes
+
+
+def verify_case(scale, width, height, backend, rows_per_second, smooth):
+    """Render all transitions with update_numbers and draw_numbers side by side
+
+    Returns the number of frames whose displayed pixels differ. The clock is
+    simulated, so time-based progression steps the same in both drawers.
+    """
+    now = [0.0]
+    matrix = VirtualMatrix(width, height)
+    dirty = create_drawer(backend, matrix.CreateFrameCanvas())
+    full = create_drawer(backend, VirtualMatrix(width, height).CreateFrameCanvas())
+    for tetris in (dirty, full):
+        tetris.scale = scale
+        tetris.smooth = smooth
+        tetris.rows_per_second = rows_per_second
+        tetris.clock = lambda: now[0]
+
+    mismatches = 0
+    frames = 0
+    for time_str in transitions():
+        dirty.set_time(time_str, True)
+        full.set_time(time_str, True)
+        idle = 0
+        while idle < IDLE_FRAMES:
+            now[0] += 1.0 / VERIFY_FPS
+            show_colon = (frames // 10) % 2 == 0
+            finished = dirty.update_numbers(2, 13 * scale, show_colon)
+            if dirty.damage:
+                dirty.flush()
+                dirty.canvas = matrix.SwapOnVSync(dirty.canvas)
+            full.clear()
+            full.draw_numbers(2, 13 * scale, show_colon)
+            full.flush()
+            if matrix.front.pixels != full.canvas.pixels:
+                mismatches += 1
+            frames += 1
+            if finished:
+                idle += 1
+    return mismatches
+
+
+def measure_peak_memory(scale, width, height, mode, backend):
+    """Return the peak memory allocated while rendering all transitions"""
+    tracemalloc.start()
+    try:
+        run_case(scale, width, height, mode, backend)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", action="store", default="1,2,3,4", help="Scales to run (default: 1,2,3,4)")
+    parser.add_argument("--chains", action="store", default="1,2,4",
+                        help="Numbers of chained panels to run (default: 1,2,4)")
+    parser.add_argument("--led-rows", action="store", default=32, type=int, help="Panel rows (default: 32)")
+    parser.add_argument("--led-cols", action="store", default=64, type=int, help="Panel columns (default: 64)")
+    parser.add_argument("--modes", action="store", default="full,dirty,timeline",
+                        help="Render modes to run (default: full,dirty,timeline)")
+    parser.add_argument("--backends", action="store", default="pixel", help="Backends to run (default: pixel)")
+    parser.add_argument("--repeat", action="store", default=1, type=int,
+                        help="Render every case this many times and keep the fastest run (default: 1)")
+    parser.add_argument("--json", action="store", help="Write the results to this file")
+    parser.add_argument("--baseline", action="store", help="Compare ns/frame against results of an earlier --json run")
+    parser.add_argument("--tolerance", action="store", default=0.2, type=float,
+                        help="Allowed ns/frame regression against the baseline (default: 0.2)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Instead of timing, check frame by frame that repainting only the changed regions "
+                             "shows the same as full redraws, also with --smooth and --rows-per-second")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        failed = False
+        for scale in [int(s) for s in args.scales.split(",")]:
+            height = max(args.led_rows, 16 * scale)
+            for backend in args.backends.split(","):
+                for rows_per_second in VERIFY_ROWS_PER_SECOND:
+                    for smooth in (False, True):
+                        mismatches = verify_case(scale, args.led_cols, height, backend, rows_per_second, smooth)
+                        failed = failed or mismatches > 0
+                        print("scale=%d backend=%s rows_per_second=%s smooth=%s: %s" % (
+                            scale, backend, rows_per_second, smooth,
+                            "%d frames differ" % mismatches if mismatches else "OK"))
+        return 1 if failed else 0
+
+    results = {}
+    for scale in [int(s) for s in args.scales.split(",")]:
+        for chain in [int(c) for c in args.chains.split(",")]:
+            width = args.led_cols * chain
+            # Tall enough to show the whole digit at this scale
+            height = max(args.led_rows, 16 * scale)
+            for mode in args.modes.split(","):
+                for backend in args.backends.split(","):
+                    frames, elapsed, set_pixel_calls, bulk_writes = min(
+                        (run_case(scale, width, height, mode, backend) for _ in range(max(args.repeat, 1))),
+                        key=lambda run: run[1])
+                    peak = measure_peak_memory(scale, width, height, mode, backend)
+                    name = "scale=%d width=%d mode=%s backend=%s" % (scale, width, mode, backend)
+                    results[name] = {
+                        "ns_per_frame": elapsed / frames,
+                        "set_pixel_per_frame": set_pixel_calls / frames,
+                        "bulk_writes_per_frame": bulk_writes / frames,
+                        "peak_memory": peak,
+                    }
+                    print("%-45s %12.0f ns/frame %10.1f SetPixel/frame %6.2f bulk/frame %8.1f KiB peak" % (
+                        name, elapsed / frames, set_pixel_calls / frames, bulk_writes / frames, peak / 1024))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [
+            name for name, result in results.items()
+            if name in baseline and
+            result["ns_per_frame"] > baseline[name]["ns_per_frame"] * (1 + args.tolerance)
+        ]
+        for name in regressions:
+            print("REGRESSION %s: %.0f ns/frame, baseline %.0f" % (
+                name, results[name]["ns_per_frame"], baseline[name]["ns_per_frame"]))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
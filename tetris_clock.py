@@ -1,14 +1,52 @@
 #!/usr/bin/env python
 import time
+# Startup is measured from here to the first frame on the panel
+STARTUP_TIME = time.perf_counter()
+
+import signal
 import sys
-import os
 import datetime
 import argparse
 
-# Add parent directory to path so we can import tetris_animation
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from rgbmatrix import RGBMatrix, RGBMatrixOptions
-from tetris_animation import TetrisMatrixDraw
+from tetris_animation import TetrisMatrixDraw, TimelineCache
+from tetris_assets import DEFAULT_CACHE_DIR, load_assets
+from tetris_metrics import ClockMetrics
+from tetris_pipeline import RenderPipeline
+from tetris_profiler import FrameProfiler
+from tetris_scheduler import FrameScheduler, night_brightness, seconds_until_next_minute
+
+def create_matrix(args):
+    """Create the LED matrix, or a virtual one if --virtual is given or the rgbmatrix bindings are missing"""
+    if not args.virtual:
+        try:
+            from rgbmatrix import RGBMatrix, RGBMatrixOptions
+        except ImportError:
+            # Bindings built in a checkout of rpi-rgb-led-matrix sit next to this directory
+            import os
+            sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            try:
+                from rgbmatrix import RGBMatrix, RGBMatrixOptions
+            except ImportError:
+                RGBMatrix = None
+        if RGBMatrix is None:
+            print("The rgbmatrix module is not available, using a virtual matrix", file=sys.stderr)
+        else:
+            options = RGBMatrixOptions()
+            options.rows = args.led_rows
+            options.cols = args.led_cols
+            options.chain_length = args.led_chain
+            options.parallel = args.led_parallel
+            options.brightness = args.led_brightness
+            options.hardware_mapping = args.led_gpio_mapping
+            return RGBMatrix(options=options)
+    
+    from tetris_virtual import VirtualMatrix
+    return VirtualMatrix(args.led_cols * args.led_chain, args.led_rows * args.led_parallel, dump_dir=args.dump_dir)
+
+
+def is_time_string(text):
+    """Return whether set_time can show a text, i.e. at most six digits besides colons and spaces"""
+    return all(c in "0123456789: " for c in text) and len(text.replace(":", "")) <= 6
 
 class TetrisClock:
     def __init__(self):
@@ -21,92 +59,336 @@ class TetrisClock:
         parser.add_argument("-b", "--led-brightness", action="store", help="Brightness (default: 100)", default=50, type=int)
         parser.add_argument("-m", "--led-gpio-mapping", help="Hardware mapping", default="adafruit-hat", 
                            choices=['regular', 'adafruit-hat', 'adafruit-hat-pwm'])
+        parser.add_argument("--virtual", action="store_true", help="Use a virtual matrix instead of the LEDs")
+        parser.add_argument("--dump-dir", action="store", help="With --virtual, write every frame here as PPM")
         parser.add_argument("--fps", action="store", help="Frames per second (default: 20)", default=20, type=int)
+        parser.add_argument("--scale", action="store", type=int, default=2, help="Clock scale (default: 2)")
+        parser.add_argument("--seconds", action="store_true", help="Show the seconds too (HH:MM:SS)")
+        parser.add_argument("--smooth", action="store_true",
+                           help="Move bricks pixel by pixel instead of a block at a time, for high frame rates")
+        parser.add_argument("--backend", help="Render backend (default: pixel)", default="pixel",
+                           choices=['pixel', 'numpy'])
+        parser.add_argument("--gamma", action="store", type=float, default=1.0,
+                           help="With --backend numpy, gamma correction applied to every frame (default: 1.0)")
+        parser.add_argument("--night-brightness", action="store", type=float, default=1.0,
+                           help="With --backend numpy, brightness factor at night, 0-1 (default: 1.0, no dimming)")
+        parser.add_argument("--night-start", action="store", default="22:00",
+                           help="Time the night dimming starts (default: 22:00)")
+        parser.add_argument("--night-end", action="store", default="07:00",
+                           help="Time the night dimming ends (default: 07:00)")
+        parser.add_argument("--fade-frames", action="store", type=int, default=0,
+                           help="With --backend numpy, cross-fade over this many frames when the time changes "
+                                "(default: 0, disabled)")
+        parser.add_argument("--full-redraw", action="store_true",
+                           help="Clear and redraw the whole frame every tick instead of only the changed regions")
+        parser.add_argument("--timeline-cache", action="store", type=int, default=0,
+                           help="With --full-redraw, replay precompiled digit timelines "
+                                "cached up to this many KiB (default: 0, disabled)")
+        parser.add_argument("--asset-cache", action="store", default=DEFAULT_CACHE_DIR,
+                           help="Directory of the precomputed glyph and timeline cache (default: %s)"
+                                % DEFAULT_CACHE_DIR)
+        parser.add_argument("--no-asset-cache", action="store_true",
+                           help="Compute glyphs and timelines as needed instead of mapping a cache file")
+        parser.add_argument("--playback", action="store",
+                           help="Play the digit animations back from a file written by tetris_recording.py")
+        parser.add_argument("--rows-per-second", action="store", type=float,
+                           help="Drop bricks at this many rows per second regardless of the achieved "
+                                "frame rate (default: one row per frame)")
+        parser.add_argument("--transition", help="Digits that animate on a time change (default: all)",
+                           default="all", choices=['all', 'changed', 'clear'])
+        parser.add_argument("--message", action="store",
+                           help="Scroll this text across the panel instead of showing the time")
+        parser.add_argument("--scroll-speed", action="store", type=float, default=20,
+                           help="With --message, pixels per second the text scrolls (default: 20)")
+        parser.add_argument("--pipeline", action="store_true",
+                           help="Render on a separate thread while the main thread waits for vsync")
+        parser.add_argument("--pipeline-depth", action="store", type=int, default=2,
+                           help="Rendered frames that may queue up for display (default: 2)")
+        parser.add_argument("--asyncio", action="store_true",
+                           help="Run the render loop as an asyncio task, swapping frames in an executor")
+        parser.add_argument("--metrics-file", action="store",
+                           help="Write Prometheus-style metrics to this file")
+        parser.add_argument("--metrics-interval", action="store", type=float, default=10,
+                           help="Seconds between metrics file writes (default: 10)")
+        parser.add_argument("--metrics-port", action="store", type=int,
+                           help="Serve Prometheus-style metrics on this local HTTP port")
+        parser.add_argument("--profile-file", action="store", default="tetris_profile.txt",
+                           help="Where SIGUSR1 writes the per-stage frame profile (default: tetris_profile.txt)")
+        parser.add_argument("--profile-frames", action="store", type=int, default=200,
+                           help="Frames profiled after SIGUSR1 (default: 200)")
+        parser.add_argument("--profile-mode", help="Profiler run along with the stage timing (default: stages)",
+                           default="stages", choices=['stages', 'cprofile', 'sample'])
         
         self.args = parser.parse_args()
+        if self.args.profile_frames < 1:
+            parser.error("--profile-frames must be at least 1")
         
-        # Set up the RGB matrix
-        options = RGBMatrixOptions()
-        options.rows = self.args.led_rows
-        options.cols = self.args.led_cols
-        options.chain_length = self.args.led_chain
-        options.parallel = self.args.led_parallel
-        options.brightness = self.args.led_brightness
-        options.hardware_mapping = self.args.led_gpio_mapping
-        
-        self.matrix = RGBMatrix(options=options)
+        # Set up the RGB matrix, the hardware bindings are only imported here
+        self.matrix = create_matrix(self.args)
         
         # Create the first canvas that we'll draw into and then swap
         self.offscreen_canvas = self.matrix.CreateFrameCanvas()
         
         # Initialize the Tetris animation
-        self.tetris = TetrisMatrixDraw(self.offscreen_canvas)
+        if self.args.playback:
+            if self.args.rows_per_second is not None or self.args.smooth:
+                parser.error("--playback shows one recorded frame per tick and cannot be combined with "
+                             "--rows-per-second or --smooth")
+            from tetris_recording import PlaybackTetrisMatrixDraw, RecordingPlayer
+            self.tetris = PlaybackTetrisMatrixDraw(self.offscreen_canvas, RecordingPlayer(self.args.playback))
+        elif self.args.backend == "numpy":
+            from tetris_numpy import NumpyTetrisMatrixDraw
+            self.tetris = NumpyTetrisMatrixDraw(self.offscreen_canvas)
+        else:
+            self.tetris = TetrisMatrixDraw(self.offscreen_canvas)
+        
+        # Gamma, night dimming and cross-fades are lookup tables applied to the numpy framebuffer
+        self.post = None
+        if self.args.gamma != 1.0 or self.args.night_brightness != 1.0 or self.args.fade_frames > 0:
+            if self.args.backend != "numpy" or self.args.playback:
+                parser.error("--gamma, --night-brightness and --fade-frames need --backend numpy")
+            from tetris_numpy import FramePostProcessor
+            self.post = FramePostProcessor(self.args.gamma)
+            self.tetris.post = self.post
+        
+        # Set scale based on matrix size, recordings come with their own scale
+        if not self.args.playback:
+            self.tetris.scale = self.args.scale
+        self.tetris.smooth = self.args.smooth
+        self.time_format = "%H:%M:%S" if self.args.seconds else "%H:%M"
+        self.y = 13 * self.tetris.scale
+        
+        if self.args.timeline_cache > 0:
+            if self.args.smooth:
+                parser.error("--timeline-cache replays whole rows and cannot be combined with --smooth")
+            self.tetris.timelines = TimelineCache(self.args.timeline_cache * 1024)
+        self.tetris.rows_per_second = self.args.rows_per_second
+        
+        # Map the glyphs and digit timelines computed by an earlier start, or compute and save them now.
+        # Only a message draws the glyphs and only full redraws replay the timelines, the plain
+        # clock would just pay for building the cache file on its first start.
+        self.assets = None
+        uses_assets = self.args.message or (self.args.full_redraw and self.tetris.timelines is not None)
+        if uses_assets and not self.args.no_asset_cache and not self.args.playback:
+            self.assets = load_assets(self.args.asset_cache, self.tetris.scale, self.matrix.width,
+                                      self.matrix.height, self.tetris.tetrisColors)
+            if self.assets is not None:
+                self.assets.install(self.tetris)
+        
+        # Animate only the digits that change, optionally dropping the old ones out first
+        self.tetris.clear_outgoing = self.args.transition == "clear"
+        
+        # Pace frames against deadlines based on desired FPS
+        self.scheduler = FrameScheduler(self.args.fps)
+        
+        # Runtime metrics, exported to a file and/or a local HTTP endpoint
+        self.metrics = ClockMetrics()
+        if self.args.metrics_port:
+            self.metrics.serve(self.args.metrics_port)
+        
+        # Profile the next frames on SIGUSR1, nothing is hooked until then
+        self.profiler = FrameProfiler(self.tetris, self.metrics, self.args.profile_file,
+                                      self.args.profile_frames, self.args.profile_mode)
+        if hasattr(signal, "SIGUSR1"):
+            self.profiler.install(signal.SIGUSR1)
+        
+        # Time string shown instead of the current time, if set, and text scrolled across the panel instead
+        self.text = None
+        self.message = self.args.message
+
+    def start(self):
+        """Reset the clock state and force the animation of the current time"""
+        self.last_time = ""
+        self.show_colon = True
+        self.colon_deadline = time.monotonic() + 1
+        self.metrics_deadline = time.monotonic()
+        
+        # A message scrolls in from the right edge and keeps animating
+        if self.message:
+            self.tetris.set_text(self.message)
+            self.tetris.text_scroll = -self.matrix.width
+            self.scroll_time = time.monotonic()
+            self.animation_active = True
+            return
+        
+        # Initial setup - force animation on first run
+        now = datetime.datetime.now()
+        current_time = now.strftime(self.time_format)
+        self.tetris.set_time(current_time, True)
+        self.animation_active = True
+
+    def set_text(self, text):
+        """Show a text instead of the time and restart the animation
+
+        Digits and colons animate like the time, any other text scrolls like
+        --message. None goes back to the time, or to --message if given.
+        """
+        if text is None:
+            text = self.args.message
+        self.text = text if text is not None and is_time_string(text) else None
+        self.message = text if self.text is None else None
+        self.start()
+
+    def update_post(self, now):
+        """Follow the night dimming; a new brightness or a fade changes every pixel, not only the damaged ones"""
+        if self.post is None:
+            return
+        if self.args.night_brightness != 1.0:
+            brightness = night_brightness(now, self.args.night_start, self.args.night_end,
+                                          self.args.night_brightness)
+            if self.post.set_brightness(brightness):
+                self.tetris.invalidate()
+        if self.post.fading:
+            self.tetris.invalidate()
+            self.animation_active = True
+
+    def render_frame(self):
+        """Draw the next frame into self.tetris.canvas; returns False if no canvas needs to change"""
+        if self.message:
+            self.update_post(datetime.datetime.now())
+            monotonic_now = time.monotonic()
+            self.tetris.scroll_text((monotonic_now - self.scroll_time) * self.args.scroll_speed)
+            self.scroll_time = monotonic_now
+            self.tetris.clear()
+            self.tetris.draw_text(0, self.y)
+            return True
+        
+        # Get current time
+        now = datetime.datetime.now()
+        current_time = self.text if self.text is not None else now.strftime(self.time_format)
+        
+        # Check if time has changed
+        if current_time != self.last_time:
+            # Time has changed, start a new animation
+            self.tetris.set_time(current_time, self.args.transition == "all")
+            self.last_time = current_time
+            self.animation_active = True
+            if self.post is not None and self.args.fade_frames > 0:
+                self.post.crossfade(self.args.fade_frames)
+        self.update_post(now)
         
-        # Set scale based on matrix size
-        self.tetris.scale = 2
+        # Update colon blinking, once per second of monotonic time
+        monotonic_now = time.monotonic()
+        if monotonic_now >= self.colon_deadline:
+            self.show_colon = not self.show_colon
+            while self.colon_deadline <= monotonic_now:
+                self.colon_deadline += 1
         
-        # Calculate sleep time based on desired FPS
-        self.sleep_time = 1.0 / self.args.fps
+        # Draw the current state
+        if self.args.full_redraw:
+            self.tetris.clear()
+            animation_complete = self.tetris.draw_numbers(2, self.y, self.show_colon)
+        else:
+            animation_complete = self.tetris.update_numbers(2, self.y, self.show_colon)
+        
+        # If animation just completed, update state; a fade keeps the frames coming
+        if self.animation_active and animation_complete and not (self.post is not None and self.post.fading):
+            self.animation_active = False
+        
+        # Neither buffer changed if no region had to be repainted
+        return self.args.full_redraw or bool(self.tetris.damage)
+
+    def export_metrics(self):
+        """Write the metrics file if it is due"""
+        if self.args.metrics_file and time.monotonic() >= self.metrics_deadline:
+            self.metrics.write_textfile(self.args.metrics_file)
+            self.metrics_deadline = time.monotonic() + self.args.metrics_interval
+
+    def idle_deadline(self):
+        """Return the monotonic time of the next wakeup when not animating, None while animating"""
+        if self.animation_active:
+            return None
+        # When not animating, only wake up for the colon or the next minute.
+        # The back buffer catches up with this frame's damage on the next wakeup.
+        if self.args.seconds:
+            until_next = 1 - datetime.datetime.now().microsecond / 1000000.0
+        else:
+            until_next = seconds_until_next_minute()
+        minute_deadline = time.monotonic() + until_next + 0.005
+        return min(self.colon_deadline, minute_deadline)
+
+    def wait_next_frame(self):
+        """Export metrics if due and sleep until the next frame"""
+        self.export_metrics()
+        deadline = self.idle_deadline()
+        if deadline is None:
+            self.scheduler.wait_frame()
+        else:
+            self.scheduler.sleep_until(deadline)
+
+    def report_startup(self):
+        """Report the time from loading this module to the first frame"""
+        startup = time.perf_counter() - STARTUP_TIME
+        self.metrics.startup_seconds = startup
+        print("First frame %.1f ms after startup (%s)" % (
+            startup * 1000, "asset cache" if self.assets is not None else "no asset cache"))
+
+    def run_serial(self):
+        """Render and swap frames one after the other on this thread"""
+        while True:
+            render_start = time.perf_counter()
+            changed = self.render_frame()
+            if changed:
+                self.tetris.flush()
+            
+            # Swap buffers, unless neither buffer changed
+            swap_start = time.perf_counter()
+            swap_time = None
+            if changed:
+                self.offscreen_canvas = self.matrix.SwapOnVSync(self.offscreen_canvas)
+                self.tetris.canvas = self.offscreen_canvas
+                swap_time = time.perf_counter() - swap_start
+            
+            self.metrics.record_frame(self.tetris, swap_start - render_start, swap_time,
+                                      self.animation_active, self.scheduler)
+            if changed and self.metrics.startup_seconds is None:
+                self.report_startup()
+            self.wait_next_frame()
+
+    def run_pipelined(self):
+        """Render frames on a separate thread while this thread swaps them on vsync"""
+        def render():
+            render_start = time.perf_counter()
+            changed = self.render_frame()
+            if changed:
+                self.tetris.flush()
+            self.metrics.record_frame(self.tetris, time.perf_counter() - render_start, None,
+                                      self.animation_active, self.scheduler)
+            return changed
+        
+        def on_swap(seconds):
+            self.metrics.record_swap(seconds)
+            if self.metrics.startup_seconds is None:
+                self.report_startup()
+        
+        pipeline = RenderPipeline(self.matrix, self.tetris, render, self.wait_next_frame,
+                                  canvas=self.offscreen_canvas, depth=self.args.pipeline_depth,
+                                  on_swap=on_swap)
+        pipeline.start()
+        try:
+            pipeline.run_display()
+        finally:
+            pipeline.stop()
 
     def run(self):
         try:
             print("Press CTRL-C to stop the clock")
-            
-            last_time = ""
-            colon_time = 0
-            show_colon = True
-            
-            # Initial setup - force animation on first run
-            now = datetime.datetime.now()
-            current_time = now.strftime("%H:%M")
-            self.tetris.set_time(current_time, True)
-            animation_active = True
-            
-            while True:
-                # Get current time
-                now = datetime.datetime.now()
-                current_time = now.strftime("%H:%M")
-                
-                # Check if time has changed
-                if current_time != last_time:
-                    # Time has changed, start a new animation
-                    self.tetris.set_time(current_time, True)
-                    last_time = current_time
-                    animation_active = True
-                
-                # Clear the offscreen canvas
-                self.offscreen_canvas.Clear()
-
-                # Update colon blinking
-                colon_time += self.sleep_time
-                if colon_time >= 1:
-                    show_colon = not show_colon
-                    colon_time = 0
-                
-                # Draw the current state
-                animation_complete = self.tetris.draw_numbers(2, 26, show_colon)
-                
-                # If animation just completed, update state
-                if animation_active and animation_complete:
-                    animation_active = False
-                
-                # Swap buffers
-                self.offscreen_canvas = self.matrix.SwapOnVSync(self.offscreen_canvas)
-                
-                # Determine sleep time - shorter during animation for smoother motion
-                # Longer when static to save CPU
-                if animation_active:
-                    time.sleep(self.sleep_time)
-                else:
-                    # When not animating, we only need to update to blink the colon
-                    # We can sleep longer, but still need to wake up to check time changes
-                    time.sleep(0.25)  # Check for time changes and update colon 4 times per second
+            self.start()
+            if self.args.asyncio:
+                import asyncio
+                from tetris_async import AsyncClockRunner
+                asyncio.run(AsyncClockRunner(self).run())
+            elif self.args.pipeline:
+                self.run_pipelined()
+            else:
+                self.run_serial()
                 
         except KeyboardInterrupt:
+            print(self.scheduler.report())
             print("Exiting...")
             sys.exit(0)
 
 # Main function
 if __name__ == "__main__":
     tetris_clock = TetrisClock()
-    tetris_clock.run()
\ No newline at end of file
+    tetris_clock.run()
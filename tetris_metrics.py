@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import bisect
+import os
+import threading
+
+# Upper bounds of the frame time histogram buckets, in seconds
+FRAME_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    """Prometheus-style histogram with fixed bucket bounds"""
+    def __init__(self, name, help_text, buckets=FRAME_TIME_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Per bucket, the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record one value"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        """Return the histogram in the Prometheus text format"""
+        lines = [
+            "# HELP %s %s" % (self.name, self.help_text),
+            "# TYPE %s histogram" % self.name,
+        ]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append('%s_bucket{le="%g"} %d' % (self.name, bound, cumulative))
+        lines.append('%s_bucket{le="+Inf"} %d' % (self.name, self.count))
+        lines.append("%s_sum %.9f" % (self.name, self.sum))
+        lines.append("%s_count %d" % (self.name, self.count))
+        return "\n".join(lines)
+
+
+class ClockMetrics:
+    """Runtime metrics of a running clock, cheap enough to keep enabled"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.render_time = Histogram("tetris_frame_render_seconds", "Time spent rendering a frame")
+        self.swap_time = Histogram("tetris_frame_swap_seconds", "Time spent pushing a frame and waiting for vsync")
+        self.frames = 0            # Frames rendered
+        self.pixel_writes = 0      # Pixels submitted to the canvas
+        self.bulk_writes = 0       # Bulk frame pushes to the canvas
+        self.last_pixel_writes = 0  # Pixels submitted in the last frame
+        self.last_bulk_writes = 0  # Bulk pushes in the last frame
+        self.falling_bricks = 0    # Bricks falling in the last frame
+        self.animating = False     # Whether the clock is animating or idle
+        self.overruns = 0          # Frames that missed their deadline
+        self.skipped = 0           # Deadlines skipped to catch up
+        self.startup_seconds = None  # Seconds from startup to the first frame on the panel
+
+    def record_frame(self, tetris, render_seconds, swap_seconds, animating, scheduler=None):
+        """Record a frame drawn by a TetrisMatrixDraw; swap_seconds is None if no swap happened"""
+        with self.lock:
+            self.frames += 1
+            self.render_time.observe(render_seconds)
+            if swap_seconds is not None:
+                self.swap_time.observe(swap_seconds)
+            self.last_pixel_writes = tetris.pixel_writes - self.pixel_writes
+            self.last_bulk_writes = tetris.bulk_writes - self.bulk_writes
+            self.pixel_writes = tetris.pixel_writes
+            self.bulk_writes = tetris.bulk_writes
+            self.falling_bricks = tetris.count_falling_bricks()
+            self.animating = animating
+            if scheduler is not None:
+                self.overruns = scheduler.overruns
+                self.skipped = scheduler.skipped
+
+    def record_swap(self, swap_seconds):
+        """Record a swap done apart from record_frame, e.g. on a display thread"""
+        with self.lock:
+            self.swap_time.observe(swap_seconds)
+
+    def render(self):
+        """Return all metrics in the Prometheus text format"""
+        with self.lock:
+            samples = [
+                ("tetris_frames_total", "counter", "Frames rendered", self.frames),
+                ("tetris_pixel_writes_total", "counter", "Pixels submitted to the canvas", self.pixel_writes),
+                ("tetris_bulk_writes_total", "counter", "Bulk frame pushes to the canvas", self.bulk_writes),
+                ("tetris_frame_overruns_total", "counter", "Frames that missed their deadline", self.overruns),
+                ("tetris_frames_skipped_total", "counter", "Frame deadlines skipped to catch up", self.skipped),
+                ("tetris_last_frame_pixel_writes", "gauge", "Pixels submitted in the last frame",
+                 self.last_pixel_writes),
+                ("tetris_last_frame_bulk_writes", "gauge", "Bulk pushes in the last frame", self.last_bulk_writes),
+                ("tetris_falling_bricks", "gauge", "Bricks falling in the last frame", self.falling_bricks),
+                ("tetris_animating", "gauge", "1 while a transition is animating, 0 when idle", int(self.animating)),
+            ]
+            if self.startup_seconds is not None:
+                samples.append(("tetris_startup_seconds", "gauge", "Seconds from startup to the first frame",
+                                round(self.startup_seconds, 6)))
+            lines = []
+            for name, kind, help_text, value in samples:
+                lines.append("# HELP %s %s" % (name, help_text))
+                lines.append("# TYPE %s %s" % (name, kind))
+                lines.append("%s %s" % (name, value))
+            lines.append(self.render_time.render())
+            lines.append(self.swap_time.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Atomically write the metrics to a file, e.g. for the node_exporter textfile collector"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the metrics over HTTP from a daemon thread and return the server"""
+        import http.server
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
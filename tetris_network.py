@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""Render the clock once and stream it to many displays over UDP"""
+import argparse
+import collections
+import datetime
+import socket
+import struct
+import sys
+import time
+import zlib
+
+from tetris_animation import TetrisMatrixDraw
+from tetris_scheduler import FrameScheduler
+from tetris_virtual import VirtualCanvas, VirtualMatrix
+
+NETWORK_MAGIC = b"TTFS"
+DEFAULT_PORT = 7420
+# magic, packet kind, sequence number, frame width, frame height
+PACKET_HEADER = struct.Struct("<4sBIHH")
+# Changed pixels: x, y, length, color
+RUN = struct.Struct("<HHHBBB")
+MAX_DATAGRAM = 65507
+# Runs that fit into one datagram even if zlib cannot compress them at all
+RUNS_PER_DATAGRAM = (MAX_DATAGRAM - PACKET_HEADER.size - 1024) // RUN.size
+
+KIND_KEYFRAME = 0              # Whole frame, applies to anything
+KIND_DELTA = 1                 # Changes against the frame with the previous sequence number
+KIND_HELLO = 2                 # Client subscription and keyframe request
+
+SUBSCRIBER_TIMEOUT = 10.0      # Seconds without a hello before a client is dropped
+HELLO_INTERVAL = 2.0           # Seconds between client hellos
+
+
+def changed_runs(previous, current, width):
+    """Return the (x, y, length, r, g, b) runs of equally colored pixels that differ between two RGB rasters"""
+    runs = []
+    stride = width * 3
+    for row in range(len(current) // stride):
+        base = row * stride
+        if previous[base:base + stride] == current[base:base + stride]:
+            continue
+        x = 0
+        while x < width:
+            i = base + x * 3
+            if previous[i:i + 3] == current[i:i + 3]:
+                x += 1
+                continue
+            color = current[i:i + 3]
+            start = x
+            x += 1
+            while x < width:
+                i = base + x * 3
+                if current[i:i + 3] != color or previous[i:i + 3] == color:
+                    break
+                x += 1
+            runs.append((start, row, x - start) + tuple(color))
+    return runs
+
+
+def encode_frame(kind, seq, width, height, runs):
+    """Pack frame runs into datagrams with consecutive sequence numbers, starting at seq
+
+    A frame too large for one datagram is split, the parts after the first
+    are deltas on top of it. A client that misses a part waits for the next
+    keyframe like after any other drop.
+    """
+    packet = PACKET_HEADER.pack(NETWORK_MAGIC, kind, seq, width, height) + zlib.compress(
+        b"".join(RUN.pack(*run) for run in runs))
+    if len(packet) <= MAX_DATAGRAM:
+        return [packet]
+    packets = []
+    for part, start in enumerate(range(0, len(runs), RUNS_PER_DATAGRAM)):
+        payload = zlib.compress(b"".join(RUN.pack(*run) for run in runs[start:start + RUNS_PER_DATAGRAM]))
+        packets.append(PACKET_HEADER.pack(NETWORK_MAGIC, kind if part == 0 else KIND_DELTA, seq + part,
+                                          width, height) + payload)
+    return packets
+
+
+def decode_packet(packet):
+    """Return (kind, seq, width, height, runs) of a datagram, or None if it is not ours or malformed"""
+    if len(packet) < PACKET_HEADER.size:
+        return None
+    magic, kind, seq, width, height = PACKET_HEADER.unpack_from(packet)
+    if magic != NETWORK_MAGIC:
+        return None
+    runs = []
+    if kind != KIND_HELLO:
+        try:
+            runs = list(RUN.iter_unpack(zlib.decompress(packet[PACKET_HEADER.size:])))
+        except (zlib.error, struct.error):
+            # Truncated or corrupted on the way, drop it like a lost packet
+            return None
+    return kind, seq, width, height, runs
+
+
+class FrameServer:
+    """Sends rendered frames to subscribed clients as keyframes and deltas"""
+    def __init__(self, width, height, host="0.0.0.0", port=DEFAULT_PORT, keyframe_interval=2.0):
+        self.width = width
+        self.height = height
+        self.keyframe_interval = keyframe_interval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.subscribers = {}      # Client address -> monotonic time of its last hello
+        self.seq = 0
+        self.previous = bytes(width * height * 3)
+        self.keyframe_due = True
+        self.next_keyframe = 0.0
+
+    def poll(self):
+        """Handle pending client hellos"""
+        while True:
+            try:
+                packet, address = self.sock.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                break
+            decoded = decode_packet(packet)
+            if decoded is not None and decoded[0] == KIND_HELLO:
+                if address not in self.subscribers or decoded[1]:
+                    # New client or a client that lost track, send a keyframe
+                    self.keyframe_due = True
+                self.subscribers[address] = time.monotonic()
+
+        now = time.monotonic()
+        for address, last_seen in list(self.subscribers.items()):
+            if now - last_seen > SUBSCRIBER_TIMEOUT:
+                del self.subscribers[address]
+
+    def publish(self, pixels):
+        """Send a rendered RGB raster to all subscribers; returns False if nothing was sent"""
+        self.poll()
+        current = bytes(pixels)
+        now = time.monotonic()
+        if self.keyframe_due or now >= self.next_keyframe:
+            kind = KIND_KEYFRAME
+            runs = changed_runs(bytes(len(current)), current, self.width)
+            self.keyframe_due = False
+            self.next_keyframe = now + self.keyframe_interval
+        else:
+            runs = changed_runs(self.previous, current, self.width)
+            if not runs:
+                return False
+            kind = KIND_DELTA
+        self.previous = current
+        packets = encode_frame(kind, self.seq + 1, self.width, self.height, runs)
+        self.seq += len(packets)
+        for packet in packets:
+            for address in self.subscribers:
+                try:
+                    self.sock.sendto(packet, address)
+                except OSError:
+                    pass
+        return True
+
+    def close(self):
+        """Close the server socket"""
+        self.sock.close()
+
+
+class FrameClient:
+    """Applies frames received from a FrameServer to a local matrix
+
+    Deltas only apply on top of the frame with the previous sequence number;
+    after a drop the client waits for a keyframe and asks the server for one.
+    """
+    def __init__(self, matrix, server_address, buffer_count=2):
+        self.matrix = matrix
+        self.server_address = server_address
+        self.canvas = matrix.CreateFrameCanvas()
+        self.frame = bytearray(matrix.width * matrix.height * 3)  # Last frame received
+        self.seq = None            # Sequence number of the last frame applied
+        self.dropped = 0           # Frames lost or received out of order
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(HELLO_INTERVAL)
+        # Regions changed by recent frames, the back buffer still has to catch up with them
+        self._history = collections.deque(maxlen=buffer_count - 1)
+        self._next_hello = 0.0
+
+    def hello(self, want_keyframe=False):
+        """Subscribe to the server, optionally asking for a keyframe"""
+        packet = PACKET_HEADER.pack(NETWORK_MAGIC, KIND_HELLO, int(want_keyframe), 0, 0)
+        self.sock.sendto(packet, self.server_address)
+        self._next_hello = time.monotonic() + HELLO_INTERVAL
+
+    def apply(self, kind, seq, width, height, runs):
+        """Apply a decoded frame; returns False if it was dropped"""
+        if kind == KIND_DELTA and (self.seq is None or seq != self.seq + 1):
+            if self.seq is None or seq > self.seq:
+                self.dropped += 1
+                self.seq = None
+                self.hello(want_keyframe=True)
+            return False
+
+        width = min(width, self.matrix.width)
+        height = min(height, self.matrix.height)
+        if kind == KIND_KEYFRAME:
+            self.frame[:] = bytes(len(self.frame))
+            regions = [(0, y, self.matrix.width) for y in range(self.matrix.height)]
+        else:
+            regions = []
+        for x, y, n, r, g, b in runs:
+            if y >= height or x >= width:
+                continue
+            n = min(n, width - x)
+            i = (y * self.matrix.width + x) * 3
+            self.frame[i:i + n * 3] = bytes((r, g, b)) * n
+            if kind != KIND_KEYFRAME:
+                regions.append((x, y, n))
+        self.seq = seq
+
+        # Copy everything that changed in this or the recent frames into the back buffer
+        set_pixel = self.canvas.SetPixel
+        frame = self.frame
+        stride = self.matrix.width
+        for changed in (regions, *self._history):
+            for x, y, n in changed:
+                for px in range(x, x + n):
+                    i = (y * stride + px) * 3
+                    set_pixel(px, y, frame[i], frame[i + 1], frame[i + 2])
+        self._history.append(regions)
+        self.canvas = self.matrix.SwapOnVSync(self.canvas)
+        return True
+
+    def poll(self):
+        """Receive and apply one frame, keeping the subscription alive"""
+        if time.monotonic() >= self._next_hello:
+            self.hello(want_keyframe=self.seq is None)
+        try:
+            packet = self.sock.recv(MAX_DATAGRAM)
+        except socket.timeout:
+            return False
+        decoded = decode_packet(packet)
+        if decoded is None or decoded[0] == KIND_HELLO:
+            return False
+        return self.apply(*decoded)
+
+    def run(self):
+        """Apply frames until interrupted"""
+        self.hello(want_keyframe=True)
+        while True:
+            self.poll()
+
+    def close(self):
+        """Close the client socket"""
+        self.sock.close()
+
+
+def serve(args):
+    """Render the clock into an offscreen canvas and publish every frame"""
+    canvas = VirtualCanvas(args.width, args.height)
+    tetris = TetrisMatrixDraw(canvas)
+    tetris.scale = args.scale
+    server = FrameServer(args.width, args.height, args.host, args.port)
+    scheduler = FrameScheduler(args.fps)
+    print("Serving frames on %s:%d" % (args.host, args.port))
+
+    last_time = ""
+    show_colon = True
+    colon_deadline = time.monotonic() + 1
+    while True:
+        current_time = datetime.datetime.now().strftime("%H:%M")
+        if current_time != last_time:
+            tetris.set_time(current_time, True)
+            last_time = current_time
+        if time.monotonic() >= colon_deadline:
+            show_colon = not show_colon
+            colon_deadline += 1
+
+        tetris.clear()
+        tetris.draw_numbers(2, 13 * args.scale, show_colon)
+        server.publish(canvas.pixels)
+        scheduler.wait_frame()
+
+
+def connect(args):
+    """Show the frames of a server on a local matrix"""
+    host, _, port = args.server.partition(":")
+    if args.virtual:
+        matrix = VirtualMatrix(args.width, args.height, dump_dir=args.dump_dir)
+    else:
+        from tetris_clock import create_matrix
+        matrix = create_matrix(args)
+    client = FrameClient(matrix, (host, int(port or DEFAULT_PORT)))
+    print("Showing frames from %s" % args.server)
+    client.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    server_parser = commands.add_parser("server", help="Render the clock and stream it")
+    server_parser.add_argument("--host", action="store", default="0.0.0.0", help="Address to bind (default: 0.0.0.0)")
+    server_parser.add_argument("--port", action="store", type=int, default=DEFAULT_PORT,
+                               help="UDP port (default: %d)" % DEFAULT_PORT)
+    server_parser.add_argument("--width", action="store", type=int, default=64, help="Frame width (default: 64)")
+    server_parser.add_argument("--height", action="store", type=int, default=32, help="Frame height (default: 32)")
+    server_parser.add_argument("--scale", action="store", type=int, default=2, help="Clock scale (default: 2)")
+    server_parser.add_argument("--fps", action="store", type=int, default=20, help="Frames per second (default: 20)")
+
+    client_parser = commands.add_parser("client", help="Show a streamed clock")
+    client_parser.add_argument("server", help="Server address as host[:port]")
+    client_parser.add_argument("--virtual", action="store_true", help="Use a virtual matrix instead of the LEDs")
+    client_parser.add_argument("--dump-dir", action="store", help="With --virtual, write every frame here as PPM")
+    client_parser.add_argument("--width", action="store", type=int, default=64,
+                               help="Virtual matrix width (default: 64)")
+    client_parser.add_argument("--height", action="store", type=int, default=32,
+                               help="Virtual matrix height (default: 32)")
+    client_parser.add_argument("-r", "--led-rows", action="store", type=int, default=32,
+                               help="Display rows (default: 32)")
+    client_parser.add_argument("--led-cols", action="store", type=int, default=64,
+                               help="Display columns (default: 64)")
+    client_parser.add_argument("-c", "--led-chain", action="store", type=int, default=1,
+                               help="Daisy-chained boards (default: 1)")
+    client_parser.add_argument("-P", "--led-parallel", action="store", type=int, default=1,
+                               help="Parallel chains (default: 1)")
+    client_parser.add_argument("-b", "--led-brightness", action="store", type=int, default=50,
+                               help="Brightness (default: 50)")
+    client_parser.add_argument("-m", "--led-gpio-mapping", default="adafruit-hat", help="Hardware mapping",
+                               choices=['regular', 'adafruit-hat', 'adafruit-hat-pwm'])
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "server":
+            serve(args)
+        else:
+            connect(args)
+    except KeyboardInterrupt:
+        print("Exiting...")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+import itertools
+
+import numpy as np
+from PIL import Image
+
+from tetris_animation import TETRIS_MAX_NUMBERS, TetrisMatrixDraw
+
+
+class FramePostProcessor:
+    """Gamma correction, dimming and cross-fades applied to a whole framebuffer through lookup tables
+
+    Every color channel value maps through one 256-entry table that combines
+    gamma and brightness, so processing a frame is a single fancy-indexed
+    lookup. A cross-fade blends the last output into the new frames with
+    precomputed per-step weight tables.
+    """
+    def __init__(self, gamma=1.0, brightness=1.0):
+        self.gamma = gamma
+        self.brightness = brightness
+        self.lut = None            # uint8 value of every channel value
+        self.last = None           # Last processed frame
+        self._fade_old = None      # Per fade step, weight of the old frame times 256 for every value
+        self._fade_new = None      # Per fade step, weight of the new frame times 256 for every value
+        self._fade_from = None     # Frame the fade started from
+        self._fade_step = 0
+        self._build_lut()
+
+    def _build_lut(self):
+        values = np.arange(256, dtype=np.float64) / 255.0
+        self.lut = np.rint(np.power(values, self.gamma) * self.brightness * 255.0).clip(0, 255).astype(np.uint8)
+
+    def set_gamma(self, gamma):
+        """Change the gamma, returns True if the tables changed"""
+        if gamma == self.gamma:
+            return False
+        self.gamma = gamma
+        self._build_lut()
+        return True
+
+    def set_brightness(self, brightness):
+        """Change the brightness factor, in steps of 1/255; returns True if the tables changed"""
+        brightness = round(min(max(brightness, 0.0), 1.0) * 255) / 255.0
+        if brightness == self.brightness:
+            return False
+        self.brightness = brightness
+        self._build_lut()
+        return True
+
+    @property
+    def fading(self):
+        return self._fade_from is not None
+
+    def crossfade(self, frames):
+        """Blend the last output into the next frames processed, over the given number of frames"""
+        if frames <= 0 or self.last is None:
+            return
+        weights = np.arange(1, frames + 1, dtype=np.float64)[:, None] / frames
+        values = np.arange(256, dtype=np.float64)[None, :]
+        self._fade_new = np.rint(values * weights * 256).astype(np.uint16)
+        self._fade_old = np.rint(values * (1 - weights) * 256).astype(np.uint16)
+        self._fade_from = self.last.copy()
+        self._fade_step = 0
+
+    def process(self, frame):
+        """Return the processed copy of an (H, W, 3) uint8 frame"""
+        out = self.lut[frame]
+        if self._fade_from is not None:
+            if self._fade_from.shape != out.shape:
+                self._fade_from = None
+            else:
+                step = self._fade_step
+                blended = self._fade_old[step][self._fade_from] + self._fade_new[step][out]
+                out = (blended >> 8).astype(np.uint8)
+                self._fade_step += 1
+                if self._fade_step >= len(self._fade_new):
+                    self._fade_from = None
+        self.last = out
+        return out
+
+
+class NumpyTetrisMatrixDraw(TetrisMatrixDraw):
+    """TetrisMatrixDraw that renders into a NumPy framebuffer and pushes it to the canvas in one call"""
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.frame = np.zeros((canvas.height, canvas.width, 3), dtype=np.uint8)
+        # Settled-brick rasters converted to arrays, keyed by layer id
+        self._layer_arrays = {}
+        # Placed timeline spans converted to arrays, keyed by PlacedSpans id
+        self._placed_arrays = {}
+        self.post = None           # FramePostProcessor applied when pushing the framebuffer, if any
+
+    def clear(self):
+        """Clear the framebuffer"""
+        self.frame.fill(0)
+        self.invalidate()
+
+    def flush(self):
+        """Push the framebuffer to the canvas, one SetImage call per repainted region"""
+        frame = self.frame if self.post is None else self.post.process(self.frame)
+        if self.damage is None:
+            self.bulk_writes += 1
+            self.canvas.SetImage(Image.fromarray(frame, "RGB"), 0, 0)
+            return
+        self.bulk_writes += len(self.damage)
+        for x0, y0, x1, y1 in self.damage:
+            self.canvas.SetImage(Image.fromarray(frame[y0:y1, x0:x1], "RGB"), x0, y0)
+
+    def draw_pixel(self, x, y, color):
+        """Draw a single pixel into the framebuffer"""
+        self.pixel_writes += 1
+        x0, y0, x1, y1 = self.clip_bounds()
+        if x0 <= x < x1 and y0 <= y < y1:
+            self.frame[y, x] = color
+
+    def fill_rect(self, x, y, w, h, color):
+        """Draw a filled rectangle with a single slice assignment"""
+        self.pixel_writes += w * h
+        clip_x0, clip_y0, clip_x1, clip_y1 = self.clip_bounds()
+        x0 = max(x, clip_x0)
+        y0 = max(y, clip_y0)
+        x1 = min(x + w, clip_x1)
+        y1 = min(y + h, clip_y1)
+        if x0 < x1 and y0 < y1:
+            self.frame[y0:y1, x0:x1] = color
+
+    def draw_sprite(self, sprite, x_pos, y_pos, color):
+        """Draw a precompiled sprite as one slice fill per block, culled against the clip rectangle"""
+        x0, y0, x1, y1 = self.clip_bounds()
+        if (x_pos + sprite.min_x >= x1 or x_pos + sprite.max_x <= x0 or
+                y_pos + sprite.min_y >= y1 or y_pos + sprite.max_y <= y0):
+            return
+        for dx, dy in sprite.blocks:
+            self.fill_rect(x_pos + dx, y_pos + dy, sprite.scale, sprite.scale, color)
+
+    def draw_spans(self, spans, x_pos, y_pos, count=None):
+        """Draw the first count (x, y, length, r, g, b) spans as one slice fill each"""
+        x0, y0, x1, y1 = self.clip_bounds()
+        for dx, dy, n, r, g, b in itertools.islice(spans, count):
+            self.pixel_writes += n
+            y = y_pos + dy
+            start = max(x_pos + dx, x0)
+            end = min(x_pos + dx + n, x1)
+            if y0 <= y < y1 and start < end:
+                self.frame[y, start:end] = (r, g, b)
+
+    def draw_placed(self, placed, count):
+        """Draw the first count spans of a PlacedSpans with one fancy-indexed assignment"""
+        if placed.bbox is None or not count:
+            return
+        x0, y0, x1, y1 = self.clip_bounds()
+        bbox = placed.bbox
+        if bbox[0] >= x1 or bbox[2] <= x0 or bbox[1] >= y1 or bbox[3] <= y0:
+            return
+        cached = self._placed_arrays.get(id(placed))
+        if cached is None or cached[0] is not placed:
+            if len(self._placed_arrays) >= 2 * TETRIS_MAX_NUMBERS:
+                # The placements of digits no longer shown, no need to keep them
+                self._placed_arrays.clear()
+            data = np.array(placed.pixels, dtype=np.int32)
+            cached = (placed, data[:, 0], data[:, 1], data[:, 2:].astype(np.uint8))
+            self._placed_arrays[id(placed)] = cached
+        written = placed.ends[count]
+        self.pixel_writes += written
+        xs = cached[1][:written]
+        ys = cached[2][:written]
+        colors = cached[3][:written]
+        if bbox[0] >= x0 and bbox[2] <= x1 and bbox[1] >= y0 and bbox[3] <= y1:
+            self.frame[ys, xs] = colors
+            return
+        visible = (xs >= x0) & (xs < x1) & (ys >= y0) & (ys < y1)
+        self.frame[ys[visible], xs[visible]] = colors[visible]
+
+    def draw_layer(self, layer, x_pos, y_pos):
+        """Draw a settled-brick raster with one fancy-indexed assignment"""
+        if layer.bbox is None:
+            return
+        x0, y0, x1, y1 = self.clip_bounds()
+        if (x_pos + layer.bbox[0] >= x1 or x_pos + layer.bbox[2] <= x0 or
+                y_pos + layer.bbox[1] >= y1 or y_pos + layer.bbox[3] <= y0):
+            return
+        self.pixel_writes += len(layer.pixels)
+        cached = self._layer_arrays.get(id(layer))
+        if cached is None or cached[0] is not layer.pixels or cached[1] != len(layer.pixels):
+            data = np.array(layer.pixels, dtype=np.int32)
+            cached = (layer.pixels, len(layer.pixels), data[:, 0], data[:, 1], data[:, 2:].astype(np.uint8))
+            self._layer_arrays[id(layer)] = cached
+        xs = cached[2] + x_pos
+        ys = cached[3] + y_pos
+        visible = (xs >= x0) & (xs < x1) & (ys >= y0) & (ys < y1)
+        self.frame[ys[visible], xs[visible]] = cached[4][visible]
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+import queue
+import threading
+import time
+
+
+class RenderPipeline:
+    """Overlaps rendering with SwapOnVSync using a render thread and a ring of canvases
+
+    A canvas belongs to the render thread from the moment it is taken from the
+    free queue until the finished frame is queued as ready, and to the display
+    thread from then on until SwapOnVSync hands it back, when it returns to the
+    free queue. The ready queue is bounded, so the render thread blocks when
+    the display falls behind. Canvases rotate in a fixed order, which keeps
+    every canvas exactly buffer_count - 1 frames behind for dirty rendering.
+    """
+    def __init__(self, matrix, tetris, render, wait, canvas=None, depth=2, on_swap=None):
+        self.matrix = matrix
+        self.tetris = tetris
+        self.render = render       # Draws and flushes the next frame into tetris.canvas, False if nothing changed
+        self.wait = wait           # Paces the render thread until the next frame is due
+        self.on_swap = on_swap     # Called with the seconds spent in SwapOnVSync, if given
+        self.free = queue.Queue()
+        self.ready = queue.Queue(maxsize=depth)
+        self.buffer_count = depth + 2  # Displayed, ready, rendering and the canvas swapped out last
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        canvases = [canvas if canvas is not None else matrix.CreateFrameCanvas()]
+        canvases += [matrix.CreateFrameCanvas() for _ in range(depth)]
+        for c in canvases:
+            self.free.put(c)
+
+    def _get(self, q):
+        """Take an item from a queue, giving up with None once the pipeline stops"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _put(self, q, item):
+        """Put an item into a queue, giving up with False once the pipeline stops"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _render_loop(self):
+        try:
+            self.tetris.buffer_count = self.buffer_count
+            canvas = self._get(self.free)
+            while canvas is not None:
+                self.tetris.canvas = canvas
+                if self.render():
+                    if not self._put(self.ready, canvas):
+                        break
+                    canvas = self._get(self.free)
+                    if canvas is None:
+                        break
+                self.wait()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._stop.set()
+
+    def start(self):
+        """Start the render thread"""
+        self._thread = threading.Thread(target=self._render_loop, name="tetris-render", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the render thread and wait for it to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_display(self):
+        """Swap ready frames onto the matrix until the pipeline stops; re-raises render errors"""
+        while True:
+            canvas = self._get(self.ready)
+            if canvas is None:
+                break
+            swap_start = time.perf_counter()
+            previous = self.matrix.SwapOnVSync(canvas)
+            if self.on_swap is not None:
+                self.on_swap(time.perf_counter() - swap_start)
+            self.free.put(previous)
+        if self.error is not None:
+            raise self.error
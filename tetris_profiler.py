@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+import collections
+import signal
+import sys
+import threading
+import time
+
+# Stage name of every TetrisMatrixDraw method that gets timed
+PROFILE_STAGES = (
+    ("clear", "clear"),
+    ("clear", "clear_rect"),
+    ("falling brick", "draw_sprite"),
+    ("settled bricks", "draw_layer"),
+    ("spans", "draw_spans"),
+    ("spans", "draw_placed"),
+    ("colon", "draw_colon"),
+    ("push", "flush"),
+)
+SAMPLE_INTERVAL = 0.001        # Seconds between stack samples in "sample" mode
+
+
+class StageTimer:
+    """Accumulated time of one stage"""
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class FrameProfiler:
+    """Times the stages of the next frames when a signal arrives, then writes a report and switches off
+
+    Nothing is hooked while it is off. The signal handler only wraps the
+    frame-boundary callback of ClockMetrics; at the next frame boundary the
+    TetrisMatrixDraw methods are wrapped with timers on the instance, and
+    after the given number of frames all wrappers are removed again. mode is
+    "stages" for stage timing only, "cprofile" to also run cProfile and
+    "sample" to also sample the stack of the render thread.
+    """
+    def __init__(self, tetris, metrics, path, frames=200, mode="stages"):
+        self.tetris = tetris
+        self.metrics = metrics
+        self.path = path
+        self.frames = frames
+        self.mode = mode
+        self.active = False
+        self._remaining = 0
+        self._stages = None
+        self._profile = None
+        self._samples = None
+        self._sampler = None
+        self._started = None
+
+    def install(self, signum=None):
+        """Switch on profiling whenever the process receives signum (default: SIGUSR1)"""
+        if signum is None:
+            signum = signal.SIGUSR1
+        signal.signal(signum, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        self.request()
+
+    def request(self):
+        """Profile the next frames, starting at the next frame boundary"""
+        if self.active or "record_frame" in vars(self.metrics):
+            return
+        record_frame = type(self.metrics).record_frame.__get__(self.metrics)
+
+        def start_then_record(*args, **kwargs):
+            record_frame(*args, **kwargs)
+            self._start()
+
+        self.metrics.record_frame = start_then_record
+
+    def _timed(self, stage, method):
+        timer = self._stages[stage]
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timer.add(perf_counter() - start)
+        return timed
+
+    def _start(self):
+        """Wrap the stages, runs on the render thread at a frame boundary"""
+        self.active = True
+        self._remaining = self.frames
+        self._stages = collections.OrderedDict(
+            (stage, StageTimer()) for stage, _ in PROFILE_STAGES + (("swap", None), ("render", None)))
+        for stage, method_name in PROFILE_STAGES:
+            setattr(self.tetris, method_name, self._timed(stage, getattr(self.tetris, method_name)))
+
+        metrics = self.metrics
+        record_frame = type(metrics).record_frame.__get__(metrics)
+        record_swap = type(metrics).record_swap.__get__(metrics)
+
+        def profiled_record_frame(tetris, render_seconds, swap_seconds, *args, **kwargs):
+            record_frame(tetris, render_seconds, swap_seconds, *args, **kwargs)
+            self._stages["render"].add(render_seconds)
+            if swap_seconds is not None:
+                self._stages["swap"].add(swap_seconds)
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self._finish()
+
+        def profiled_record_swap(swap_seconds):
+            record_swap(swap_seconds)
+            self._stages["swap"].add(swap_seconds)
+
+        metrics.record_frame = profiled_record_frame
+        metrics.record_swap = profiled_record_swap
+
+        if self.mode == "cprofile":
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.mode == "sample":
+            self._samples = collections.Counter()
+            self._sampler = threading.Thread(target=self._sample, args=(threading.get_ident(),),
+                                             name="tetris-sampler", daemon=True)
+            self._sampler.start()
+        self._started = time.perf_counter()
+
+    def _sample(self, thread_id):
+        """Count the stacks of the render thread until profiling ends"""
+        while self.active:
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s:%d" % (code.co_filename.rsplit("/", 1)[-1], code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self._samples[";".join(reversed(stack))] += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _finish(self):
+        """Remove all wrappers and write the report"""
+        elapsed = time.perf_counter() - self._started
+        if self._profile is not None:
+            self._profile.disable()
+        self.active = False
+        if self._sampler is not None:
+            self._sampler.join()
+        for _, method_name in PROFILE_STAGES:
+            vars(self.tetris).pop(method_name, None)
+        vars(self.metrics).pop("record_frame", None)
+        vars(self.metrics).pop("record_swap", None)
+
+        try:
+            self.write_report(elapsed)
+        except OSError as e:
+            print("Could not write the profile to %s: %s" % (self.path, e), file=sys.stderr)
+        self._profile = None
+        self._samples = None
+        self._sampler = None
+
+    def write_report(self, elapsed):
+        """Write the stage timings and any profiler output to self.path"""
+        frames = self.frames
+        # Per-frame columns of an empty profile are zero rather than a division by zero
+        per_frame = 1.0 / frames if frames > 0 else 0.0
+        lines = [
+            "Profile of %d frames over %.3f s, written %s" % (
+                frames, elapsed, time.strftime("%Y-%m-%d %H:%M:%S")),
+            "",
+            "%-16s %8s %12s %12s %12s" % ("stage", "calls", "total ms", "ms/frame", "max ms"),
+        ]
+        for stage, timer in self._stages.items():
+            lines.append("%-16s %8d %12.3f %12.4f %12.4f" % (
+                stage, timer.calls, timer.total * 1000, timer.total * 1000 * per_frame, timer.max * 1000))
+        # Render time not spent in any stage, e.g. advancing the animation and finding the damage
+        other = self._stages["render"].total - sum(
+            self._stages[stage].total for stage in set(name for name, _ in PROFILE_STAGES))
+        lines.append("%-16s %8s %12.3f %12.4f" % ("other render", "", other * 1000, other * 1000 * per_frame))
+        if self._profile is not None:
+            import io
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(30)
+            lines += ["", "cProfile, by cumulative time:", out.getvalue()]
+        if self._samples is not None:
+            lines += ["", "Stack samples of the render thread (folded, most frequent first):"]
+            lines += ["%s %d" % (stack, count) for stack, count in self._samples.most_common()]
+        with open(self.path, "w") as f:
+            f.write("\n".join(lines) + "\n")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""Record the digit animations to a compact file and play them back without computing them"""
+import argparse
+import mmap
+import struct
+import sys
+
+from tetris_animation import (TetrisMatrixDraw, NUMBER_ARRAYS, TETRIS_MAX_NUMBERS, TETRIS_Y_DROP_DEFAULT,
+                              get_rotation, get_sprite, union_rects)
+from tetris_virtual import VirtualCanvas
+
+RECORDING_MAGIC = b"TTRC"
+RECORDING_VERSION = 1
+# magic, version, scale, digit box min_x, min_y, width, height
+HEADER = struct.Struct("<4sHHhhHH")
+# Per digit: offset of its frame offset table, number of frames
+DIGIT_ENTRY = struct.Struct("<II")
+FRAME_OFFSET = struct.Struct("<I")
+RUN_COUNT = struct.Struct("<H")
+# Run-length encoded pixels of a frame: x, y relative to the digit origin, length, color
+RUN = struct.Struct("<hhHBBB")
+
+
+def digit_box(scale):
+    """Return the (min_x, min_y, width, height) box any digit animation covers, relative to its origin"""
+    scaled_y_offset = scale if scale > 1 else 1
+    min_x = min_y = 0
+    max_x = max_y = 0
+    for number_array in NUMBER_ARRAYS:
+        for fall in number_array:
+            for fallindex in range(fall.y_stop + 1):
+                sprite = get_sprite(fall.blocktype, get_rotation(fall, fallindex), scale)
+                x_pos = fall.x_pos * scale
+                y_pos = (fallindex * scaled_y_offset) - scaled_y_offset
+                min_x = min(min_x, x_pos + sprite.min_x)
+                min_y = min(min_y, y_pos + sprite.min_y)
+                max_x = max(max_x, x_pos + sprite.max_x)
+                max_y = max(max_y, y_pos + sprite.max_y)
+    return min_x, min_y, max_x - min_x, max_y - min_y
+
+
+def frame_runs(pixels, width, min_x, min_y):
+    """Return the runs of equally colored, non-black pixels of a packed RGB raster"""
+    runs = []
+    stride = width * 3
+    black = b"\x00\x00\x00"
+    for row in range(len(pixels) // stride):
+        base = row * stride
+        if not any(pixels[base:base + stride]):
+            continue
+        x = 0
+        while x < width:
+            i = base + x * 3
+            color = pixels[i:i + 3]
+            start = x
+            x += 1
+            while x < width and pixels[base + x * 3:base + x * 3 + 3] == color:
+                x += 1
+            if color != black:
+                runs.append((start + min_x, row + min_y, x - start) + tuple(color))
+    return runs
+
+
+def record_digit(digit, scale, box):
+    """Render one digit animation and return its frames as lists of runs"""
+    min_x, min_y, width, height = box
+    canvas = VirtualCanvas(width, height)
+    tetris = TetrisMatrixDraw(canvas)
+    tetris.scale = scale
+    tetris.sizeOfValue = 1
+    tetris.set_num_state(0, digit, 0)
+
+    frames = []
+    finished = False
+    while not finished:
+        tetris.clear()
+        finished = tetris.draw_numbers(-min_x, TETRIS_Y_DROP_DEFAULT * scale - min_y)
+        frames.append(frame_runs(canvas.pixels, width, min_x, min_y))
+    return frames
+
+
+def record(path, scale):
+    """Record the animations of all digits at a given scale to a file"""
+    box = digit_box(scale)
+    digits = [record_digit(digit, scale, box) for digit in range(len(NUMBER_ARRAYS))]
+
+    # Header, digit table, frame offset tables, then the frames themselves
+    offset = HEADER.size + DIGIT_ENTRY.size * len(digits)
+    table_offsets = []
+    for frames in digits:
+        table_offsets.append(offset)
+        offset += FRAME_OFFSET.size * len(frames)
+
+    data = bytearray(HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, scale, *box))
+    for table_offset, frames in zip(table_offsets, digits):
+        data += DIGIT_ENTRY.pack(table_offset, len(frames))
+    frame_data = bytearray()
+    for frames in digits:
+        for runs in frames:
+            data += FRAME_OFFSET.pack(offset + len(frame_data))
+            frame_data += RUN_COUNT.pack(len(runs))
+            for run in runs:
+                frame_data += RUN.pack(*run)
+    data += frame_data
+
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+class RecordingPlayer:
+    """Memory-mapped recording of the digit animations"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.scale, min_x, min_y, width, height = HEADER.unpack_from(self.data, 0)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError("%s is not a tetris clock recording" % path)
+        self.box = (min_x, min_y, width, height)
+        self.digits = [DIGIT_ENTRY.unpack_from(self.data, HEADER.size + DIGIT_ENTRY.size * digit)
+                       for digit in range(len(NUMBER_ARRAYS))]
+        self._bboxes = {}          # Rectangle covered by each (digit, frame index) looked up so far
+        self._changes = {}         # Rectangle changed since the frame before, per (digit, frame index)
+
+    def frame_count(self, digit):
+        """Return the number of frames of a digit animation"""
+        return self.digits[digit][1]
+
+    def frame(self, digit, index):
+        """Return the (x, y, length, r, g, b) runs of a frame of a digit animation"""
+        table_offset, _ = self.digits[digit]
+        offset = FRAME_OFFSET.unpack_from(self.data, table_offset + FRAME_OFFSET.size * index)[0]
+        count = RUN_COUNT.unpack_from(self.data, offset)[0]
+        start = offset + RUN_COUNT.size
+        return RUN.iter_unpack(memoryview(self.data)[start:start + RUN.size * count])
+
+    def frame_bbox(self, digit, index):
+        """Return the (x0, y0, x1, y1) rectangle covered by a frame relative to the digit origin, None if empty"""
+        key = (digit, index)
+        if key not in self._bboxes:
+            bbox = None
+            for x, y, n, _, _, _ in self.frame(digit, index):
+                bbox = union_rects(bbox, (x, y, x + n, y + 1))
+            self._bboxes[key] = bbox
+        return self._bboxes[key]
+
+    def frame_change(self, digit, index):
+        """Return the rectangle in which a frame differs from the one before it, relative to the digit origin
+
+        Runs are maximal, so every changed pixel lies in a run that only one
+        of the two frames has. None if the frames are the same.
+        """
+        key = (digit, index)
+        if key not in self._changes:
+            before = set(self.frame(digit, index - 1))
+            after = set(self.frame(digit, index))
+            bbox = None
+            for x, y, n, _, _, _ in before ^ after:
+                bbox = union_rects(bbox, (x, y, x + n, y + 1))
+            self._changes[key] = bbox
+        return self._changes[key]
+
+    def close(self):
+        """Unmap the recording"""
+        self.data.close()
+
+
+class PlaybackTetrisMatrixDraw(TetrisMatrixDraw):
+    """TetrisMatrixDraw that streams recorded frames to the canvas instead of computing them
+
+    Digits are drawn from the recorded runs in the same order as
+    draw_numbers, so overlapping bricks of neighbouring digits come out the
+    same. update_numbers only repaints the digits whose recorded frame changed.
+    """
+    def __init__(self, canvas, player):
+        super().__init__(canvas)
+        self.player = player
+        self.scale = player.scale
+        self.frame_index = [0] * TETRIS_MAX_NUMBERS  # Recorded frame each digit shows next
+        self.frame_shown = [None] * TETRIS_MAX_NUMBERS  # (digit, frame index) each digit showed last
+
+    def set_num_state(self, index, value, x_shift):
+        """Set the state of a digit at a given index and restart its recording"""
+        super().set_num_state(index, value, x_shift)
+        if index < TETRIS_MAX_NUMBERS:
+            self.frame_index[index] = 0
+
+    def count_falling_bricks(self):
+        """Return the number of digits whose recording has not reached its last frame"""
+        return sum(
+            1 for numpos, numstate in enumerate(self.numstates[:self.sizeOfValue])
+            if 0 <= numstate.num_to_draw < 10 and
+            self.frame_index[numpos] < self.player.frame_count(numstate.num_to_draw) - 1
+        )
+
+    def invalidate(self):
+        """Forget what is on the canvas, so the next update_numbers repaints everything"""
+        super().invalidate()
+        self.frame_shown = [None] * TETRIS_MAX_NUMBERS
+
+    def advance_frames(self):
+        """Return the (position, previously shown, digit, frame index) of every digit and step them to the next frame"""
+        finished_animating = True
+        shown = []
+        for numpos in range(self.sizeOfValue):
+            digit = self.numstates[numpos].num_to_draw
+            if 0 <= digit < 10:
+                last = self.player.frame_count(digit) - 1
+                index = min(self.frame_index[numpos], last)
+                if index < last:
+                    finished_animating = False
+                    self.frame_index[numpos] += 1
+                shown.append((numpos, self.frame_shown[numpos], digit, index))
+                self.frame_shown[numpos] = (digit, index)
+        return shown, finished_animating
+
+    def draw_recorded(self, numpos, digit, x_pos, y_pos):
+        """Draw the recorded frame a digit shows with its origin at the given position"""
+        self.draw_spans(self.player.frame(digit, self.frame_shown[numpos][1]), x_pos, y_pos)
+
+    def draw_numbers(self, x=0, y=0, display_colon=False):
+        """Draw the recorded frame of every digit"""
+        base_y = y - (TETRIS_Y_DROP_DEFAULT * self.scale)
+        shown, finished_animating = self.advance_frames()
+        for numpos, _, digit, _ in shown:
+            self.draw_recorded(numpos, digit, x + self.numstates[numpos].x_shift, base_y)
+        if display_colon:
+            for offset in self.colon_offsets():
+                self.draw_colon(x + offset, base_y, self.tetrisWHITE)
+        return finished_animating
+
+    def update_numbers(self, x=0, y=0, display_colon=False):
+        """Draw the recorded frame of every digit, only repainting the digits whose frame changed
+
+        The repainted rectangles are left in self.damage, an empty list means
+        no canvas needs to change.
+        """
+        base_y = y - (TETRIS_Y_DROP_DEFAULT * self.scale)
+        shown, finished_animating = self.advance_frames()
+
+        # A digit stays the same scene entry while it plays, the rectangle
+        # changed since the frame it showed before is damaged explicitly
+        scene = {}
+        damage = []
+        for numpos, previous, digit, index in shown:
+            origin_x = x + self.numstates[numpos].x_shift
+            if previous == (digit, index - 1):
+                changed = self.player.frame_change(digit, index)
+            elif previous is not None and previous != (digit, index):
+                changed = union_rects(self.player.frame_bbox(*previous), self.player.frame_bbox(digit, index))
+            else:
+                changed = None
+            if changed is not None:
+                damage.append((changed[0] + origin_x, changed[1] + base_y,
+                               changed[2] + origin_x, changed[3] + base_y))
+            bbox = self.player.frame_bbox(digit, index)
+            if bbox is not None:
+                scene[("digit", numpos)] = ("draw_recorded", (numpos, digit, origin_x, base_y),
+                                            (bbox[0] + origin_x, bbox[1] + base_y,
+                                             bbox[2] + origin_x, bbox[3] + base_y))
+        if display_colon:
+            for offset in self.colon_offsets():
+                scene[("colon", offset)] = ("draw_colon", (x + offset, base_y, self.tetrisWHITE),
+                                            self.colon_bbox(x + offset, base_y))
+
+        self.repaint_scene(scene, damage)
+        return finished_animating
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output", help="Recording file to write")
+    parser.add_argument("--scale", action="store", type=int, default=2, help="Scale to record (default: 2)")
+    args = parser.parse_args(argv)
+    size = record(args.output, args.scale)
+    print("Wrote %d bytes to %s" % (size, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+import datetime
+import time
+
+
+def seconds_until_next_minute(now=None):
+    """Return the wall-clock seconds left until the next minute starts"""
+    if now is None:
+        now = datetime.datetime.now()
+    return 60 - now.second - now.microsecond / 1000000.0
+
+
+def night_brightness(now, start, end, level, ramp_minutes=30):
+    """Return the brightness factor for a datetime, dimming to level between the start and end hh:mm
+
+    The brightness ramps linearly over ramp_minutes before start and after
+    end, so the change is not noticeable.
+    """
+    def minutes(hhmm):
+        hours, _, mins = hhmm.partition(":")
+        return int(hours) * 60 + int(mins or 0)
+
+    day = 24 * 60
+    current = now.hour * 60 + now.minute + now.second / 60.0
+    night_start = minutes(start)
+    night_length = (minutes(end) - night_start) % day
+    into_night = (current - night_start) % day
+    if into_night < night_length:
+        # Night, brightening again over the last minutes before it ends
+        remaining = night_length - into_night
+        dimmed = 1.0 if ramp_minutes <= 0 else min(1.0, remaining / ramp_minutes)
+    else:
+        # Day, dimming over the last minutes before the night starts
+        until_night = day - into_night
+        dimmed = 0.0 if ramp_minutes <= 0 else max(0.0, 1.0 - until_night / ramp_minutes)
+    return 1.0 - dimmed * (1.0 - level)
+
+
+class FrameScheduler:
+    """Paces frames against time.monotonic deadlines instead of fixed sleeps
+
+    Deadlines advance by exactly one frame time, so render time does not add
+    to the frame period. When a frame overruns its deadline, the missed
+    deadlines are skipped instead of being rendered back to back.
+    """
+    def __init__(self, fps, clock=time.monotonic, sleep=time.sleep):
+        self.frame_time = 1.0 / fps
+        self.clock = clock
+        self.sleep = sleep
+        self.deadline = None       # monotonic time the next frame is due
+        self.frames = 0            # Frames paced by wait_frame
+        self.overruns = 0          # Frames that finished after their deadline
+        self.skipped = 0           # Deadlines dropped to catch up after overruns
+        self.idle_wakeups = 0      # Wakeups from sleep_until
+        self.jitter_total = 0.0    # Sum of wakeup lateness, in seconds
+        self.jitter_max = 0.0      # Largest wakeup lateness, in seconds
+
+    def set_fps(self, fps):
+        """Change the frame rate, starting with the next deadline"""
+        self.frame_time = 1.0 / fps
+
+    def wait_frame(self):
+        """Sleep until the next frame deadline and return the number of skipped frames"""
+        skipped, delay = self._begin_frame()
+        if delay is not None:
+            self.sleep(delay)
+            self._end_frame()
+        return skipped
+
+    async def wait_frame_async(self, sleep=None):
+        """Like wait_frame, but awaits the given coroutine function (default: asyncio.sleep) instead of blocking"""
+        if sleep is None:
+            import asyncio
+            sleep = asyncio.sleep
+        skipped, delay = self._begin_frame()
+        if delay is not None:
+            await sleep(delay)
+            self._end_frame()
+        return skipped
+
+    def sleep_until(self, deadline):
+        """Sleep until a monotonic deadline; frame pacing restarts from there"""
+        now = self.clock()
+        if deadline > now:
+            self.sleep(deadline - now)
+        self._end_idle(deadline, now)
+
+    async def sleep_until_async(self, deadline, sleep=None):
+        """Like sleep_until, but awaits the given coroutine function (default: asyncio.sleep) instead of blocking"""
+        if sleep is None:
+            import asyncio
+            sleep = asyncio.sleep
+        now = self.clock()
+        if deadline > now:
+            await sleep(deadline - now)
+        self._end_idle(deadline, now)
+
+    def _begin_frame(self):
+        """Return the frames skipped after an overrun and the seconds to sleep, None if late"""
+        now = self.clock()
+        if self.deadline is None:
+            self.deadline = now
+        self.frames += 1
+
+        if now > self.deadline:
+            self.overruns += 1
+            skipped = int((now - self.deadline) / self.frame_time)
+            self.skipped += skipped
+            self.deadline += (skipped + 1) * self.frame_time
+            return skipped, None
+        return 0, self.deadline - now
+
+    def _end_frame(self):
+        self._record_jitter(self.clock() - self.deadline)
+        self.deadline += self.frame_time
+
+    def _end_idle(self, deadline, now):
+        self.idle_wakeups += 1
+        self.deadline = max(deadline, now) + self.frame_time
+
+    def _record_jitter(self, lateness):
+        lateness = abs(lateness)
+        self.jitter_total += lateness
+        self.jitter_max = max(self.jitter_max, lateness)
+
+    def report(self):
+        """Return a one-line summary of the frame timing"""
+        jitter_mean = self.jitter_total / max(self.frames - self.overruns, 1)
+        return "frames: %d, overruns: %d, skipped: %d, idle wakeups: %d, jitter: %.2f ms mean, %.2f ms max" % (
+            self.frames, self.overruns, self.skipped, self.idle_wakeups,
+            jitter_mean * 1000, self.jitter_max * 1000)
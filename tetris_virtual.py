@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+import os
+import struct
+import zlib
+
+
+class VirtualCanvas:
+    """In-memory stand-in for an rgbmatrix FrameCanvas"""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(width * height * 3)  # Packed RGB rows
+        self.set_pixel_calls = 0   # Number of SetPixel calls since the counters were reset
+        self.bulk_writes = 0       # Number of SetImage calls since the counters were reset
+
+    def SetPixel(self, x, y, r, g, b):
+        """Set a single pixel, ignoring coordinates outside the canvas"""
+        self.set_pixel_calls += 1
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = (y * self.width + x) * 3
+            self.pixels[i:i + 3] = bytes((r, g, b))
+
+    def Clear(self):
+        """Set all pixels to black"""
+        self.pixels[:] = bytes(len(self.pixels))
+
+    def Fill(self, r, g, b):
+        """Set all pixels to the given color"""
+        self.pixels[:] = bytes((r, g, b)) * (self.width * self.height)
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        """Copy a PIL-style RGB image onto the canvas"""
+        self.bulk_writes += 1
+        width, height = image.size
+        data = image.convert("RGB").tobytes() if image.mode != "RGB" else image.tobytes()
+        x0 = max(offset_x, 0)
+        x1 = min(offset_x + width, self.width)
+        if x0 >= x1:
+            return
+        for row in range(max(offset_y, 0), min(offset_y + height, self.height)):
+            src = ((row - offset_y) * width + (x0 - offset_x)) * 3
+            dst = (row * self.width + x0) * 3
+            self.pixels[dst:dst + (x1 - x0) * 3] = data[src:src + (x1 - x0) * 3]
+
+    def GetPixel(self, x, y):
+        """Return the (r, g, b) color of a pixel"""
+        i = (y * self.width + x) * 3
+        return tuple(self.pixels[i:i + 3])
+
+    def reset_counters(self):
+        """Reset the SetPixel and SetImage counters"""
+        self.set_pixel_calls = 0
+        self.bulk_writes = 0
+
+    def save_ppm(self, path):
+        """Write the canvas as a binary PPM image"""
+        with open(path, "wb") as f:
+            f.write(b"P6 %d %d 255\n" % (self.width, self.height))
+            f.write(self.pixels)
+
+    def save_png(self, path):
+        """Write the canvas as an uncompressed-filter PNG image"""
+        stride = self.width * 3
+        raw = b"".join(b"\x00" + bytes(self.pixels[row * stride:(row + 1) * stride])
+                       for row in range(self.height))
+
+        def chunk(kind, data):
+            return (struct.pack(">I", len(data)) + kind + data +
+                    struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)))
+            f.write(chunk(b"IDAT", zlib.compress(raw)))
+            f.write(chunk(b"IEND", b""))
+
+
+class VirtualMatrix:
+    """In-memory stand-in for an rgbmatrix RGBMatrix with double buffering
+
+    If dump_dir is given, every frame swapped in is written there as
+    frame_NNNNNN.ppm or .png, depending on dump_format.
+    """
+    def __init__(self, width=64, height=32, dump_dir=None, dump_format="ppm"):
+        self.width = width
+        self.height = height
+        self.dump_dir = dump_dir
+        self.dump_format = dump_format
+        self.frame_count = 0       # Number of frames swapped in
+        self.front = VirtualCanvas(width, height)  # Canvas currently on display
+
+    def CreateFrameCanvas(self):
+        """Create an offscreen canvas for double buffering"""
+        return VirtualCanvas(self.width, self.height)
+
+    def SwapOnVSync(self, canvas, framerate_fraction=1):
+        """Display the given canvas and return the one that was on display"""
+        previous = self.front
+        self.front = canvas
+        self.frame_count += 1
+        if self.dump_dir is not None:
+            path = os.path.join(self.dump_dir, "frame_%06d.%s" % (self.frame_count, self.dump_format))
+            if self.dump_format == "png":
+                canvas.save_png(path)
+            else:
+                canvas.save_ppm(path)
+        return previous
+
+    def SetPixel(self, x, y, r, g, b):
+        """Set a pixel of the displayed canvas"""
+        self.front.SetPixel(x, y, r, g, b)
+
+    def Clear(self):
+        """Clear the displayed canvas"""
+        self.front.Clear()
+
+    def Fill(self, r, g, b):
+        """Fill the displayed canvas"""
+        self.front.Fill(r, g, b)
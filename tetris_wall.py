@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""Show a grid of clocks, one per timezone, rendered by a pool of worker processes"""
+import argparse
+import collections
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+from tetris_animation import TetrisMatrixDraw
+from tetris_scheduler import FrameScheduler
+from tetris_virtual import VirtualCanvas, VirtualMatrix
+
+try:
+    from PIL import Image
+except ImportError:  # Composite with SetPixel instead
+    Image = None
+
+
+class ClockTile:
+    """Placement of one clock on the wall"""
+    def __init__(self, x, y, scale=2, timezone=None):
+        self.x = x                 # Left edge on the wall
+        self.y = y                 # Top edge on the wall
+        self.scale = scale
+        self.timezone = timezone   # IANA timezone name, None for local time
+        self.width = 32 * scale
+        self.height = 16 * scale
+
+    @property
+    def rect(self):
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+
+def grid_layout(timezones, columns, scale=2, x=0, y=0):
+    """Place one clock per timezone on a grid, row by row"""
+    tiles = []
+    for index, timezone in enumerate(timezones):
+        tile = ClockTile(0, 0, scale, timezone)
+        tile.x = x + (index % columns) * tile.width
+        tile.y = y + (index // columns) * tile.height
+        tiles.append(tile)
+    return tiles
+
+
+def layout_size(tiles):
+    """Return the (width, height) needed to show all tiles"""
+    return max(tile.rect[2] for tile in tiles), max(tile.rect[3] for tile in tiles)
+
+
+def _wall_worker(conn, shm_name, wall_width, wall_height, tiles):
+    """Render a shard of the tiles into the shared framebuffer whenever the main process asks for a frame"""
+    import zoneinfo
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        states = []
+        for tile in tiles:
+            canvas = VirtualCanvas(tile.width, tile.height)
+            tetris = TetrisMatrixDraw(canvas)
+            tetris.scale = tile.scale
+            # The tile canvas keeps its content, so only the changed regions are drawn
+            tetris.buffer_count = 1
+            tzinfo = zoneinfo.ZoneInfo(tile.timezone) if tile.timezone else None
+            states.append([tile, tetris, tzinfo, None])
+
+        stride = wall_width * 3
+        while True:
+            timestamp = conn.recv()
+            if timestamp is None:
+                break
+            damage = []
+            for state in states:
+                tile, tetris, tzinfo, last_time = state
+                now = datetime.datetime.fromtimestamp(timestamp, tzinfo)
+                current_time = now.strftime("%H:%M")
+                if current_time != last_time:
+                    tetris.set_time(current_time, last_time is None)
+                    state[3] = current_time
+                tetris.update_numbers(2, 13 * tile.scale, now.second % 2 == 0)
+
+                pixels = tetris.canvas.pixels
+                for x0, y0, x1, y1 in tetris.damage:
+                    # Clip to the wall, tiles may hang over its edges
+                    x1 = min(x1, wall_width - tile.x)
+                    y1 = min(y1, wall_height - tile.y)
+                    if x0 >= x1 or y0 >= y1:
+                        continue
+                    for row in range(y0, y1):
+                        src = (row * tile.width + x0) * 3
+                        dst = (tile.y + row) * stride + (tile.x + x0) * 3
+                        shm.buf[dst:dst + (x1 - x0) * 3] = pixels[src:src + (x1 - x0) * 3]
+                    damage.append((tile.x + x0, tile.y + y0, tile.x + x1, tile.y + y1))
+            conn.send(damage)
+    finally:
+        shm.close()
+        conn.close()
+
+
+class ClockWall:
+    """Renders many clocks in parallel into one shared-memory framebuffer
+
+    Tiles are sharded across worker processes that keep their animation
+    state between frames. Every frame the main process hands out a timestamp,
+    waits for all workers and then copies the regions they changed onto the
+    canvas to be swapped.
+    """
+    def __init__(self, tiles, width=None, height=None, workers=None, buffer_count=2):
+        if width is None or height is None:
+            width, height = layout_size(tiles)
+        self.tiles = tiles
+        self.width = width
+        self.height = height
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(tiles)))
+        self.shm = shared_memory.SharedMemory(create=True, size=width * height * 3)
+        self.frame = self.shm.buf  # Packed RGB rows of the whole wall
+        self.damage = []           # Regions changed by the last render
+        # Regions changed by recent frames, the canvas being drawn still has to catch up with them
+        self._history = collections.deque(maxlen=buffer_count - 1)
+        self._connections = []
+        self._processes = []
+
+    def start(self):
+        """Start the worker processes"""
+        for shard in range(self.workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_wall_worker, name="tetris-wall-%d" % shard, daemon=True,
+                args=(child, self.shm.name, self.width, self.height, self.tiles[shard::self.workers]))
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def render(self, timestamp=None):
+        """Let every worker draw the frame for a wall-clock timestamp; returns the changed regions"""
+        if timestamp is None:
+            timestamp = time.time()
+        for conn in self._connections:
+            conn.send(timestamp)
+        self.damage = []
+        for conn in self._connections:
+            self.damage.extend(conn.recv())
+        return self.damage
+
+    def composite(self, canvas):
+        """Copy the regions changed by this and the recent frames onto a canvas; returns False if none did"""
+        regions = list(self.damage)
+        for changed in self._history:
+            regions.extend(changed)
+        self._history.append(self.damage)
+        if not regions:
+            return False
+
+        stride = self.width * 3
+        for x0, y0, x1, y1 in regions:
+            if Image is not None:
+                rows = b"".join(self.frame[row * stride + x0 * 3:row * stride + x1 * 3] for row in range(y0, y1))
+                canvas.SetImage(Image.frombytes("RGB", (x1 - x0, y1 - y0), rows), x0, y0)
+                continue
+            for row in range(y0, y1):
+                base = row * stride
+                for x in range(x0, x1):
+                    i = base + x * 3
+                    canvas.SetPixel(x, row, self.frame[i], self.frame[i + 1], self.frame[i + 2])
+        return True
+
+    def stop(self):
+        """Stop the workers and release the framebuffer"""
+        for conn in self._connections:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join()
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        self._processes = []
+        self.frame.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--timezones", action="store", default="",
+                        help="Comma-separated IANA timezones, one clock each (default: one local clock)")
+    parser.add_argument("--columns", action="store", type=int, default=2, help="Clocks per row (default: 2)")
+    parser.add_argument("--scale", action="store", type=int, default=2, help="Clock scale (default: 2)")
+    parser.add_argument("--workers", action="store", type=int,
+                        help="Worker processes (default: one per core)")
+    parser.add_argument("--fps", action="store", type=int, default=20, help="Frames per second (default: 20)")
+    parser.add_argument("--virtual", action="store_true", help="Use a virtual matrix instead of the LEDs")
+    parser.add_argument("--dump-dir", action="store", help="With --virtual, write every frame here as PPM")
+    parser.add_argument("-r", "--led-rows", action="store", type=int, default=32, help="Display rows (default: 32)")
+    parser.add_argument("--led-cols", action="store", type=int, default=64, help="Display columns (default: 64)")
+    parser.add_argument("-c", "--led-chain", action="store", type=int, default=1,
+                        help="Daisy-chained boards (default: 1)")
+    parser.add_argument("-P", "--led-parallel", action="store", type=int, default=1,
+                        help="Parallel chains (default: 1)")
+    parser.add_argument("-b", "--led-brightness", action="store", type=int, default=50,
+                        help="Brightness (default: 50)")
+    parser.add_argument("-m", "--led-gpio-mapping", default="adafruit-hat", help="Hardware mapping",
+                        choices=['regular', 'adafruit-hat', 'adafruit-hat-pwm'])
+    args = parser.parse_args(argv)
+
+    timezones = [name.strip() for name in args.timezones.split(",") if name.strip()] or [None]
+    tiles = grid_layout(timezones, args.columns, args.scale)
+    if args.virtual:
+        matrix = VirtualMatrix(*layout_size(tiles), dump_dir=args.dump_dir)
+    else:
+        from tetris_clock import create_matrix
+        matrix = create_matrix(args)
+
+    wall = ClockWall(tiles, matrix.width, matrix.height, args.workers)
+    scheduler = FrameScheduler(args.fps)
+    canvas = matrix.CreateFrameCanvas()
+    wall.start()
+    try:
+        print("Showing %d clocks on %d workers" % (len(tiles), wall.workers))
+        while True:
+            wall.render()
+            if wall.composite(canvas):
+                canvas = matrix.SwapOnVSync(canvas)
+            scheduler.wait_frame()
+    except KeyboardInterrupt:
+        print(scheduler.report())
+        print("Exiting...")
+    finally:
+        wall.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())